@@ -1,63 +1,328 @@
+import io
 import os
+import sys
+import json
+import re
+import time
 import yaml
+import shutil
+import tempfile
 import subprocess
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import xarray as xr
 from datetime import datetime, timedelta
 
-with open(os.path.join(os.path.dirname(__file__), "../config.yaml")) as f:
-    config = yaml.safe_load(f)
+config_path = os.path.join(os.path.dirname(__file__), "../config.yaml")
 
-raw_dir = config["raw_grib_dir"]
-temp_dir = config["temp_grib_dir"]
-out_dir = config["processed_netcdf_dir"]
-os.makedirs(temp_dir, exist_ok=True)
+def load_config(path=config_path):
+    with open(path) as f:
+        return yaml.safe_load(f)
 
-start_time = datetime.strptime(config["start_time"], "%Y-%m-%d %H:%M")
-end_time = datetime.strptime(config["end_time"], "%Y-%m-%d %H:%M")
-step = timedelta(hours=config["step_hours"])
-forecast_hour = int(config["forecast_hour"])
-variables = config["variables"]
+def parse_forecast_hours(config):
+    """
+    forecast_hours may be a list ([0, 24, 48]) or a range
+    ({start: 0, end: 120, step: 6}); a single forecast_hour still works.
+    """
+    hours = config.get("forecast_hours", config.get("forecast_hour"))
+    if isinstance(hours, dict):
+        return list(range(int(hours["start"]), int(hours["end"]) + 1, int(hours.get("step", 1))))
+    if isinstance(hours, (list, tuple)):
+        return [int(h) for h in hours]
+    return [int(hours)]
 
+def configure(new_config):
+    """
+    Set the module-wide settings from a config dict. Importing applies
+    config.yaml; a long-lived process or test can call this again instead of
+    re-importing. Worker processes are configured the same way, so they see
+    the caller's settings rather than config.yaml.
+    """
+    global config, raw_dir, temp_dir, out_dir, start_time, end_time, step, forecast_hours, variables
+    global convert_mode, convert_backend, convert_workers, parallel_by, stack_levels
+    global zarr_store, zarr_chunks, force_convert, persist_inventory
+    global extent, lon_min, lon_max, lat_min, lat_max, small_grib_args
+    config = new_config
 
-extent = config.get("extent", None)
-if extent:
-    lon_min, lon_max, lat_min, lat_max = extent
-    small_grib_args = ["-small_grib", f"{lon_min}:{lon_max}", f"{lat_min}:{lat_max}"]
-    print(f"📍 Applying region subsetting: {extent}")
-else:
-    small_grib_args = []
+    raw_dir = config["raw_grib_dir"]
+    temp_dir = config["temp_grib_dir"]
+    out_dir = config["processed_netcdf_dir"]
 
-def grib_exists(grib_file, match_string):
+    start_time = datetime.strptime(config["start_time"], "%Y-%m-%d %H:%M")
+    end_time = datetime.strptime(config["end_time"], "%Y-%m-%d %H:%M")
+    step = timedelta(hours=config["step_hours"])
+
+    forecast_hours = parse_forecast_hours(config)
+    variables = config["variables"]
+    convert_mode = config.get("convert_mode", "per_level")
+    convert_backend = config.get("convert_backend", "wgrib2")
+    convert_workers = int(config.get("convert_workers", 1))
+    parallel_by = config.get("parallel_by", "time")  # "time" or "variable"
+    stack_levels = bool(config.get("stack_levels", False))
+    zarr_store = config.get("zarr_store")
+    zarr_chunks = config.get("zarr_chunks", "map")  # "map" or "timeseries"
+    force_convert = bool(config.get("force_convert", False))
+    persist_inventory = bool(config.get("persist_inventory", False))
+
+    extent = config.get("extent", None)
+    if extent:
+        lon_min, lon_max, lat_min, lat_max = extent
+        small_grib_args = ["-small_grib", f"{lon_min}:{lon_max}", f"{lat_min}:{lat_max}"]
+    else:
+        small_grib_args = []
+
+configure(load_config())
+
+def raw_grib_path(init_time, lead):
+    return os.path.join(raw_dir, f"gfs_{init_time:%Y%m%d}_t{init_time:%H}z_f{lead:03d}.grib2")
+
+def output_label(init_time, lead):
+    # A single lead keeps the <date>_t<HH>z directories; a lead-time matrix adds _f<FFF>
+    label = init_time.strftime("%Y%m%d_t%Hz")
+    return label if len(forecast_hours) == 1 else f"{label}_f{lead:03d}"
+
+# === GRIB inventory cache ===
+_inventories = {}
+
+def parse_inventory(text):
+    # "12:4213887:d=2025071400:TMP:700 mb:48 hour fcst:" -> {(name, level): [records]}
+    index = {}
+    for line in text.splitlines():
+        fields = line.split(":")
+        if len(fields) < 5:
+            continue
+        rec = {"msg": fields[0], "offset": int(fields[1]), "name": fields[3], "level": fields[4],
+               "ftime": fields[5] if len(fields) > 5 else "", "line": line}
+        index.setdefault((rec["name"], rec["level"]), []).append(rec)
+    return index
+
+def inventory_key(grib_file):
+    # (path, size, mtime), or None if the file is missing
+    try:
+        st = os.stat(grib_file)
+    except OSError:
+        return None
+    return (grib_file, st.st_size, st.st_mtime)
+
+def get_inventory(grib_file):
+    """
+    Parsed `wgrib2 -s` inventory of grib_file. wgrib2 runs at most once per
+    file version (size + mtime); with persist_inventory the text is also kept
+    next to the raw file as <grib>.inv and reused by later runs.
+    """
+    key = inventory_key(grib_file)
+    if key is None:
+        return {}
+    if key in _inventories:
+        return _inventories[key]
+
+    inv_path = grib_file + ".inv"
+    text = None
+    if persist_inventory and os.path.exists(inv_path) and os.path.getmtime(inv_path) >= key[2]:
+        with open(inv_path) as f:
+            text = f.read()
+    if text is None:
+        try:
+            text = subprocess.check_output(["wgrib2", "-s", grib_file], encoding="utf-8")
+        except Exception as e:
+            print(f"❌ Could not inventory {grib_file}: {e}")
+            text = ""
+        if persist_inventory and text:
+            # Per-process temp name: workers may inventory the same file at once
+            tmp_path = f"{inv_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                f.write(text)
+            os.replace(tmp_path, inv_path)
+
+    _inventories[key] = parse_inventory(text)
+    return _inventories[key]
+
+def is_statistical(rec):
+    # "42-48 hour ave fcst", "0-48 hour acc fcst": a statistic over a forecast interval
+    return re.match(r"\d+-\d+ ", rec["ftime"]) is not None
+
+def find_messages(grib_file, name, lev):
+    """
+    The one message converted for (name, lev). Fields sent both as
+    instantaneous values and as interval statistics (e.g. cloud cover) keep
+    the instantaneous message, otherwise the first in the file; the eccodes
+    backend applies the same rule.
+    """
+    messages = get_inventory(grib_file).get((name, lev), [])
+    instant = [rec for rec in messages if not is_statistical(rec)]
+    return (instant or messages)[:1]
+
+# === Stacked pressure levels ===
+def stack_dataset(ds, name):
+    """
+    Fold NAME_1000mb, NAME_925mb, ... into one float32 NAME(time, pressure,
+    latitude, longitude) variable, chunked one map per (time, level). Fields
+    without pressure levels (HPBL_surface, LCDC_lowcloudlayer) pass through.
+    Returns the dataset and its to_netcdf encoding.
+    """
+    level_vars = {}
+    for var_name in ds.data_vars:
+        m = re.fullmatch(rf"{re.escape(name)}_(\d+)mb", var_name)
+        if m:
+            level_vars[int(m.group(1))] = var_name
+    if not level_vars:
+        return ds, {}
+
+    pressures = sorted(level_vars, reverse=True)
+    stacked = xr.concat([ds[level_vars[p]] for p in pressures], dim="pressure")
+    stacked = stacked.assign_coords(pressure=np.array(pressures, dtype=np.int32)).astype(np.float32)
+    stacked = stacked.transpose(*[d for d in ("time", "pressure", "latitude", "longitude") if d in stacked.dims])
+    stacked.attrs = {k: v for k, v in ds[level_vars[pressures[0]]].attrs.items() if k not in ("level", "short_name")}
+    stacked.attrs["short_name"] = name
+
+    out = ds.drop_vars(list(level_vars.values()))
+    out[name] = stacked
+    out["pressure"].attrs = {"units": "hPa", "long_name": "pressure", "positive": "down"}
+    chunks = tuple(1 if d in ("time", "pressure") else stacked.sizes[d] for d in stacked.dims)
+    return out, {name: {"chunksizes": chunks}}
+
+def add_lead_coords(ds, init_time, lead):
+    # time is the valid time; lead_time and init_time ride along it
+    n = ds.sizes["time"]
+    return ds.assign_coords(
+        lead_time=("time", np.full(n, np.timedelta64(lead, "h")).astype("timedelta64[ns]")),
+        init_time=("time", np.full(n, np.datetime64(init_time, "ns"))),
+    )
+
+def finish_dataset(ds, name, init_time, lead):
+    # Lead/init coordinates for a lead-time matrix, plus the stacked layout when stack_levels is set
+    if len(forecast_hours) > 1:
+        ds = add_lead_coords(ds, init_time, lead)
+    encoding = {}
+    if stack_levels:
+        ds, encoding = stack_dataset(ds, name)
+        if encoding:
+            print(f"🧱 Stacked {ds.sizes['pressure']} pressure levels into {name}")
+    return ds, encoding
+
+def finish_wgrib2_output(nc_path, name, init_time, lead):
+    # Rewrite a wgrib2 NetCDF with finish_dataset (temp file, then rename).
+    # A single lead without stack_levels has nothing to add and is left as written.
+    if len(forecast_hours) == 1 and not stack_levels:
+        return
+    with xr.open_dataset(nc_path) as ds:
+        ds.load()
+    ds, encoding = finish_dataset(ds, name, init_time, lead)
+    ds.to_netcdf(nc_path + ".tmp", encoding=encoding)
+    os.replace(nc_path + ".tmp", nc_path)
+
+# === Incremental conversion ===
+def output_settings(var):
+    # The conversion settings an output NetCDF depends on, apart from its source file
+    return {
+        "variable": var["name"],
+        "levels": list(var.get("levels", [])),
+        "extent": list(extent) if extent else None,
+        "stack_levels": stack_levels,
+        "backend": convert_backend,
+        "mode": convert_mode,
+    }
+
+def source_manifest(grib_file, var):
+    # Everything an output NetCDF depends on; any change means it is rebuilt
+    st = os.stat(grib_file)
+    return {
+        "grib_file": os.path.basename(grib_file),
+        "grib_size": st.st_size,
+        "grib_mtime": st.st_mtime,
+        **output_settings(var),
+    }
+
+def is_current(final_nc, manifest):
+    if force_convert or not os.path.exists(final_nc):
+        return False
     try:
-        output = subprocess.check_output(["wgrib2", "-s", grib_file], encoding="utf-8")
-        return match_string in output
-    except Exception:
+        with open(final_nc + ".json") as f:
+            return json.load(f) == manifest
+    except (OSError, ValueError):
         return False
 
-def convert_one_time(init_time):
-    date_str = init_time.strftime("%Y%m%d")
-    hour_str = init_time.strftime("%H")
-    fxx = f"{forecast_hour:03d}"
-    grib_file = os.path.join(raw_dir, f"gfs_{date_str}_t{hour_str}z_f{fxx}.grib2")
-    timestamp = f"{date_str}_t{hour_str}z"
+def write_manifest(final_nc, manifest):
+    path = final_nc + ".json"
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(path + ".tmp", path)
+
+def finish_output(final_nc, manifest, ok):
+    """
+    Move a finished <name>.nc.part into place with its manifest. A partial
+    .part never replaces an existing output; with no earlier output it is
+    kept without a manifest, so it is retried next run.
+    """
+    part_nc = final_nc + ".part"
+    if not os.path.exists(part_nc):
+        return
+    if ok:
+        os.replace(part_nc, final_nc)
+        write_manifest(final_nc, manifest)
+    elif os.path.exists(final_nc):
+        print(f"⚠️ Keeping previous {final_nc} — conversion was incomplete")
+        os.remove(part_nc)
+    else:
+        if os.path.exists(final_nc + ".json"):
+            os.remove(final_nc + ".json")
+        os.replace(part_nc, final_nc)
+
+def stale_variables(grib_file, out_time_dir, var_list):
+    """
+    Pick the variables whose NetCDF must be (re)built, with their manifests.
+    Outputs built from this exact GRIB file, level list and extent are
+    skipped. If the raw file is gone, existing outputs are kept as they are.
+    """
+    todo, manifests, failures = [], {}, []
+    for var in var_list:
+        name = var["name"]
+        final_nc = os.path.join(out_time_dir, f"{name}.nc")
+        if not os.path.exists(grib_file):
+            if os.path.exists(final_nc):
+                print(f"⏭️ Keeping {final_nc} — raw file no longer on disk")
+            else:
+                print(f"❌ Missing raw file {grib_file} for {name}")
+                failures.append(f"{name}: missing {grib_file}")
+            continue
+        manifest = source_manifest(grib_file, var)
+        if is_current(final_nc, manifest):
+            print(f"⏭️ Up to date: {final_nc}")
+            continue
+        todo.append(var)
+        manifests[name] = manifest
+    return todo, manifests, failures
+
+def convert_one_time(init_time, lead, var_list=None, work_dir=None):
+    var_list = var_list or variables
+    work_dir = work_dir or temp_dir
+    grib_file = raw_grib_path(init_time, lead)
+    timestamp = output_label(init_time, lead)
     out_time_dir = os.path.join(out_dir, timestamp)
     os.makedirs(out_time_dir, exist_ok=True)
+    todo, manifests, failures = stale_variables(grib_file, out_time_dir, var_list)
 
-    for var in variables:
+    for var in todo:
         name = var["name"]
         levels = var.get("levels", [])
         final_nc = os.path.join(out_time_dir, f"{name}.nc")
-        if os.path.exists(final_nc):
-            os.remove(final_nc)  # Ensure fresh start
+        # Levels are appended into a .part file that only replaces final_nc once complete
+        part_nc = final_nc + ".part"
+        if os.path.exists(part_nc):
+            os.remove(part_nc)
+        n_failed = len(failures)
 
         for i, lev in enumerate(levels):
-            match_str = f":{name}:{lev}:"
-            if not grib_exists(grib_file, match_str):
+            messages = find_messages(grib_file, name, lev)
+            if not messages:
                 print(f"⚠️ Skipping {name} {lev} — not found in GRIB")
                 continue
 
             clean_lev = lev.replace(" ", "").replace(".", "")
-            temp_grib = os.path.join(temp_dir, f"{name}_{clean_lev}_{timestamp}.grb2")
-            extract_cmd = ["wgrib2", grib_file, "-match", match_str, "-grib_out", temp_grib]
+            temp_grib = os.path.join(work_dir, f"{name}_{clean_lev}_{timestamp}.grb2")
+            # The inventory hit is pulled out by message number instead of a regex scan
+            extract_cmd = ["wgrib2", grib_file, "-d", messages[0]["msg"], "-grib_out", temp_grib]
             print("📦 Extracting:", " ".join(extract_cmd))
             try:
                 subprocess.run(extract_cmd, check=True)
@@ -65,20 +330,393 @@ def convert_one_time(init_time):
                 nc_cmd = ["wgrib2", temp_grib]
                 if small_grib_args:
                     nc_cmd += small_grib_args
-                if i > 0:
+                if os.path.exists(part_nc):
                     nc_cmd += ["-append"]
-                nc_cmd += ["-netcdf", final_nc]
+                nc_cmd += ["-netcdf", part_nc]
 
                 print("🔧 Converting:", " ".join(nc_cmd))
                 subprocess.run(nc_cmd, check=True)
                 print(f"✅ Added {lev} to {final_nc}")
             except subprocess.CalledProcessError as e:
                 print(f"❌ Failed: {e}")
+                failures.append(f"{name} {lev}: {e}")
             finally:
                 if os.path.exists(temp_grib):
                     os.remove(temp_grib)
 
-current = start_time
-while current <= end_time:
-    convert_one_time(current)
-    current += step
+        if os.path.exists(part_nc):
+            finish_wgrib2_output(part_nc, name, init_time, lead)
+        finish_output(final_nc, manifests[name], len(failures) == n_failed)
+    return failures
+
+def convert_one_time_single_pass(init_time, lead, var_list=None, work_dir=None):
+    """
+    One wgrib2 call per variable with no intermediate GRIB: `wgrib2 -i` reads
+    the cached inventory lines of that variable's messages, so only those are
+    decoded, cropped with -small_grib and written straight to NetCDF with all
+    levels at once (no per-level temp files or -append). work_dir is unused.
+    """
+    var_list = var_list or variables
+    grib_file = raw_grib_path(init_time, lead)
+    timestamp = output_label(init_time, lead)
+    out_time_dir = os.path.join(out_dir, timestamp)
+    os.makedirs(out_time_dir, exist_ok=True)
+    todo, manifests, failures = stale_variables(grib_file, out_time_dir, var_list)
+    if not todo:
+        return failures
+
+    selected = {}
+    for var in todo:
+        name = var["name"]
+        for lev in var.get("levels", []):
+            messages = find_messages(grib_file, name, lev)
+            if not messages:
+                print(f"⚠️ Skipping {name} {lev} — not found in GRIB")
+            selected.setdefault(name, []).extend(messages)
+    selected = {name: recs for name, recs in selected.items() if recs}
+    if not selected:
+        print(f"❌ Nothing to convert in {grib_file}")
+        return failures + [f"nothing to convert in {grib_file}"]
+
+    for name, records in selected.items():
+        final_nc = os.path.join(out_time_dir, f"{name}.nc")
+        part_nc = final_nc + ".part"
+        if os.path.exists(part_nc):
+            os.remove(part_nc)
+        inv_lines = "".join(rec["line"] + "\n" for rec in sorted(records, key=lambda rec: rec["offset"]))
+        nc_cmd = ["wgrib2", "-i", grib_file] + small_grib_args + ["-netcdf", part_nc]
+        print(f"🔧 Converting {len(records)} messages:", " ".join(nc_cmd))
+        try:
+            subprocess.run(nc_cmd, input=inv_lines, text=True, check=True)
+            finish_wgrib2_output(part_nc, name, init_time, lead)
+            finish_output(final_nc, manifests[name], True)
+            print(f"✅ Wrote {len(records)} levels to {final_nc}")
+        except subprocess.CalledProcessError as e:
+            print(f"❌ Failed: {e}")
+            failures.append(f"{name}: {e}")
+            if os.path.exists(part_nc):
+                os.remove(part_nc)
+    return failures
+
+# === In-process (eccodes) backend ===
+# wgrib2 abbreviations -> GRIB2 (discipline, parameterCategory, parameterNumber),
+# which stays stable where eccodes shortNames for NCEP local parameters do not
+GRIB2_PARAMS = {
+    "TMP": (0, 0, 0), "SPFH": (0, 1, 0), "RH": (0, 1, 1), "CLMR": (0, 1, 22),
+    "UGRD": (0, 2, 2), "VGRD": (0, 2, 3), "VVEL": (0, 2, 8), "PRES": (0, 3, 0),
+    "PRMSL": (0, 3, 1), "HGT": (0, 3, 5), "MSLET": (0, 3, 192), "HPBL": (0, 3, 196),
+    "TCDC": (0, 6, 1), "LCDC": (0, 6, 3), "MCDC": (0, 6, 4), "HCDC": (0, 6, 5),
+}
+# wgrib2 level names -> eccodes typeOfLevel
+GRIB2_LEVELS = {
+    "surface": "surface",
+    "mean sea level": "meanSea",
+    "low cloud layer": "lowCloudLayer",
+    "middle cloud layer": "middleCloudLayer",
+    "high cloud layer": "highCloudLayer",
+}
+
+def eccodes_key(name, lev):
+    if lev.endswith(" mb"):
+        return GRIB2_PARAMS[name] + ("isobaricInhPa", int(float(lev[:-3])))
+    return GRIB2_PARAMS[name] + (GRIB2_LEVELS.get(lev, lev), 0)
+
+def decode_messages(grib_file, wanted):
+    """
+    Scan grib_file once with eccodes, decoding values only for messages whose
+    (discipline, category, number, typeOfLevel, level) is in `wanted`. Each hit is cropped to
+    `extent` and returned as {(name, lev): (valid_time, lat, lon, values)}. As in
+    find_messages, an instantaneous message wins over an interval statistic,
+    otherwise the first message in the file is kept.
+    """
+    import eccodes
+
+    fields = {}
+    instant = {}
+    with open(grib_file, "rb") as f:
+        while True:
+            gid = eccodes.codes_grib_new_from_file(f)
+            if gid is None:
+                break
+            try:
+                level_type = eccodes.codes_get(gid, "typeOfLevel")
+                # Only pressure levels are told apart by number; surface-type levels all map to 0
+                level = eccodes.codes_get(gid, "level") if level_type == "isobaricInhPa" else 0
+                key = tuple(eccodes.codes_get(gid, k) for k in ("discipline", "parameterCategory", "parameterNumber"))
+                key += (level_type, level)
+                if key not in wanted:
+                    continue
+                is_instant = eccodes.codes_get(gid, "stepType") == "instant"
+                if wanted[key] in fields and (instant[wanted[key]] or not is_instant):
+                    continue
+
+                ni = eccodes.codes_get(gid, "Ni")
+                nj = eccodes.codes_get(gid, "Nj")
+                lat = np.linspace(eccodes.codes_get(gid, "latitudeOfFirstGridPointInDegrees"),
+                                  eccodes.codes_get(gid, "latitudeOfLastGridPointInDegrees"), nj)
+                lon = np.linspace(eccodes.codes_get(gid, "longitudeOfFirstGridPointInDegrees"),
+                                  eccodes.codes_get(gid, "longitudeOfLastGridPointInDegrees"), ni)
+                values = eccodes.codes_get_values(gid).reshape(nj, ni)
+                if eccodes.codes_get(gid, "bitmapPresent"):
+                    values = np.where(values == eccodes.codes_get(gid, "missingValue"), np.nan, values)
+                valid_time = datetime.strptime(
+                    f"{eccodes.codes_get(gid, 'validityDate')}{eccodes.codes_get(gid, 'validityTime'):04d}",
+                    "%Y%m%d%H%M",
+                )
+            finally:
+                eccodes.codes_release(gid)
+
+            # Match wgrib2 -netcdf output: latitude ascending
+            if lat[0] > lat[-1]:
+                lat = lat[::-1]
+                values = values[::-1, :]
+            if extent:
+                lon_sel = np.where((lon >= lon_min) & (lon <= lon_max))[0]
+                lat_sel = np.where((lat >= lat_min) & (lat <= lat_max))[0]
+                lon, lat = lon[lon_sel], lat[lat_sel]
+                values = values[np.ix_(lat_sel, lon_sel)]
+            fields[wanted[key]] = (valid_time, lat, lon, values.astype(np.float32))
+            instant[wanted[key]] = is_instant
+    return fields
+
+def convert_one_time_eccodes(init_time, lead, var_list=None, work_dir=None):
+    # Decoding happens in memory, so work_dir is unused
+    var_list = var_list or variables
+    grib_file = raw_grib_path(init_time, lead)
+    timestamp = output_label(init_time, lead)
+    out_time_dir = os.path.join(out_dir, timestamp)
+    os.makedirs(out_time_dir, exist_ok=True)
+    todo, manifests, failures = stale_variables(grib_file, out_time_dir, var_list)
+    if not todo:
+        return failures
+
+    wanted = {}
+    for var in todo:
+        if var["name"] not in GRIB2_PARAMS:
+            print(f"⚠️ Skipping {var['name']} — no GRIB2 parameter mapping for the eccodes backend")
+            continue
+        for lev in var.get("levels", []):
+            wanted[eccodes_key(var["name"], lev)] = (var["name"], lev)
+    print(f"🔍 Decoding {grib_file}")
+    try:
+        fields = decode_messages(grib_file, wanted)
+    except Exception as e:
+        print(f"❌ Failed: {e}")
+        return failures + [f"decode: {e}"]
+
+    for var in todo:
+        name = var["name"]
+        data_vars = {}
+        for lev in var.get("levels", []):
+            if (name, lev) not in fields:
+                print(f"⚠️ Skipping {name} {lev} — not found in GRIB")
+                continue
+            valid_time, lat, lon, values = fields[(name, lev)]
+            clean_lev = lev.replace(" ", "").replace(".", "")
+            data_vars[f"{name}_{clean_lev}"] = xr.DataArray(
+                values[np.newaxis],
+                dims=("time", "latitude", "longitude"),
+                coords={"time": [np.datetime64(valid_time, "ns")], "latitude": lat, "longitude": lon},
+                attrs={"short_name": f"{name}_{clean_lev}", "level": lev},
+            )
+        if not data_vars:
+            continue
+
+        final_nc = os.path.join(out_time_dir, f"{name}.nc")
+        ds = xr.Dataset(data_vars)
+        ds["latitude"].attrs["units"] = "degrees_north"
+        ds["longitude"].attrs["units"] = "degrees_east"
+        ds.attrs["reference_time"] = init_time.strftime("%Y-%m-%d %H:%M")
+        ds, encoding = finish_dataset(ds, name, init_time, lead)
+        try:
+            ds.to_netcdf(final_nc + ".part", encoding=encoding)
+            finish_output(final_nc, manifests[name], True)
+            print(f"✅ Wrote {len(data_vars)} levels to {final_nc}")
+        except Exception as e:
+            print(f"❌ Failed: {e}")
+            failures.append(f"{name}: {e}")
+    return failures
+
+def convert(init_time, lead, var_list=None, work_dir=None):
+    # Picked per call, so configure() can switch backend or mode
+    if convert_backend == "eccodes":
+        return convert_one_time_eccodes(init_time, lead, var_list, work_dir)
+    if convert_mode == "single_pass":
+        return convert_one_time_single_pass(init_time, lead, var_list, work_dir)
+    return convert_one_time(init_time, lead, var_list, work_dir)
+
+# === Campaign Zarr archive ===
+def archive_chunks(ds, name, n_init_times):
+    # map: one full (lat, lon) map per chunk; timeseries: the whole campaign per 32x32 tile
+    if zarr_chunks == "timeseries":
+        sizes = {"init_time": n_init_times, "lead_time": 1, "pressure": 1, "latitude": 32, "longitude": 32}
+    else:
+        sizes = {"init_time": 1, "lead_time": 1, "pressure": 1}
+    chunks = []
+    for d in ds[name].dims:
+        size = sizes.get(d, ds.sizes[d])
+        # init_time grows with every append, so its chunk may exceed the current length
+        chunks.append(size if d == "init_time" else min(size, ds.sizes[d]))
+    return tuple(chunks)
+
+def append_to_archive(init_time):
+    """
+    Append one init time's converted NetCDFs to zarr_store. Each variable
+    lives in its own group with dims (init_time, lead_time, [pressure,]
+    latitude, longitude), since variables carry different pressure-level
+    sets; valid_time is a 2-D coordinate. Pressure levels are always stacked
+    (whatever stack_levels says) onto the configured level list, with NaN
+    for levels missing from the GRIB. Init times already in the store are
+    skipped; a store whose layout no longer matches the config raises.
+    """
+    init_value = np.datetime64(init_time, "ns")
+    leads = np.array([np.timedelta64(h, "h") for h in forecast_hours], dtype="timedelta64[ns]")
+    n_init_times = len(list(init_times()))
+    for var in variables:
+        name = var["name"]
+        pressures = sorted((int(float(lev[:-3])) for lev in var.get("levels", []) if lev.endswith(" mb")),
+                           reverse=True)
+        per_lead = []
+        for lead in forecast_hours:
+            nc_path = os.path.join(out_dir, output_label(init_time, lead), f"{name}.nc")
+            if not os.path.exists(nc_path):
+                continue
+            with xr.open_dataset(nc_path) as ds:
+                ds = ds.load()
+            # NAME_<level>mb files are stacked here; stacked files pass through unchanged
+            ds, _ = stack_dataset(ds, name)
+            if "pressure" in ds.dims:
+                ds = ds.reindex(pressure=np.array(pressures, dtype=np.int32))
+                ds["pressure"].attrs = {"units": "hPa", "long_name": "pressure", "positive": "down"}
+            # The single valid time (and the coordinates along it) gives way to a lead_time dim
+            per_lead.append(ds.isel(time=0, drop=True).expand_dims(lead_time=[np.timedelta64(lead, "h")]))
+        if not per_lead:
+            continue
+
+        # Leads that did not convert are NaN, so every init time has the same shape
+        ds = xr.concat(per_lead, dim="lead_time").reindex(lead_time=leads)
+        ds = ds.expand_dims(init_time=[init_value])
+        ds = ds.assign_coords(valid_time=ds["init_time"] + ds["lead_time"])
+        ds.attrs = {}
+
+        group_path = os.path.join(zarr_store, name)
+        if os.path.isdir(group_path):
+            with xr.open_zarr(zarr_store, group=name) as existing:
+                if init_value in existing["init_time"].values:
+                    continue
+                layout = (set(existing.data_vars), {d: n for d, n in existing.sizes.items() if d != "init_time"})
+            # A store built with another level list or extent cannot take this append
+            if layout != (set(ds.data_vars), {d: n for d, n in ds.sizes.items() if d != "init_time"}):
+                raise ValueError(f"{name} {init_time:%Y%m%d_t%Hz} does not match the layout of {group_path} "
+                                 f"(levels or extent changed since the store was created)")
+            ds.to_zarr(zarr_store, group=name, append_dim="init_time")
+        else:
+            encoding = {v: {"chunks": archive_chunks(ds, v, n_init_times)} for v in ds.data_vars}
+            # Fixed integer-hour units so later appends at 6-hourly steps encode exactly
+            for coord in ("init_time", "valid_time"):
+                encoding[coord] = {"units": "hours since 1970-01-01", "dtype": "int64"}
+            ds.to_zarr(zarr_store, group=name, mode="w", encoding=encoding)
+    print(f"🗄️ Archived {init_time:%Y%m%d_t%Hz} into {zarr_store}")
+
+def init_times():
+    current = start_time
+    while current <= end_time:
+        yield current
+        current += step
+
+def init_lead_pairs():
+    # The full init x lead matrix; every pair is an independent task
+    return [(t, lead) for t in init_times() for lead in forecast_hours]
+
+def run_task(init_time, lead, var_list=None, inventory=None):
+    """
+    Convert one (init time, lead) GRIB file, or one variable of it, in its
+    own temp directory, so parallel workers never share temp_grib_dir file
+    names. Output is captured and returned with the result instead of
+    interleaving on stdout. An inventory built by the parent is reused
+    instead of running `wgrib2 -s` again.
+    """
+    key = inventory_key(raw_grib_path(init_time, lead))
+    if inventory and key is not None:
+        _inventories[key] = inventory
+    label = output_label(init_time, lead)
+    if var_list:
+        label += " " + ",".join(var["name"] for var in var_list)
+    work_dir = tempfile.mkdtemp(prefix=f"{init_time:%Y%m%d%H}_f{lead:03d}_", dir=temp_dir)
+    log = io.StringIO()
+    t0 = time.time()
+    try:
+        with contextlib.redirect_stdout(log):
+            failures = convert(init_time, lead, var_list=var_list, work_dir=work_dir)
+    except Exception as e:
+        failures = [f"{type(e).__name__}: {e}"]
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return label, failures or [], time.time() - t0, log.getvalue()
+
+def run_parallel(workers=None):
+    workers = workers or convert_workers
+    if parallel_by == "variable":
+        # Each file is inventoried once here rather than by every variable's worker
+        inventories = {}
+        if convert_backend != "eccodes":
+            inventories = {(t, lead): get_inventory(raw_grib_path(t, lead)) for t, lead in init_lead_pairs()}
+        tasks = [(t, lead, [var], inventories.get((t, lead))) for t, lead in init_lead_pairs() for var in variables]
+    else:
+        tasks = [(t, lead, None) for t, lead in init_lead_pairs()]
+
+    print(f"🚀 Converting {len(tasks)} tasks on {workers} workers (by {parallel_by})")
+    t0 = time.time()
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=configure, initargs=(config,)) as pool:
+        futures = [pool.submit(run_task, *task) for task in tasks]
+        for future in as_completed(futures):
+            label, failures, elapsed, _ = result = future.result()
+            results.append(result)
+            print(f"{'❌' if failures else '✅'} {label} ({elapsed:.1f}s)")
+
+    failed = sorted((r for r in results if r[1]), key=lambda r: r[0])
+    print(f"\n📊 Converted {len(results) - len(failed)}/{len(results)} tasks in {time.time() - t0:.1f}s")
+    for label, _, _, log in failed:
+        print(f"\n❌ {label}:\n{log.rstrip()}")
+    return results
+
+def make_dirs():
+    os.makedirs(temp_dir, exist_ok=True)
+
+def main(config=None, workers=None):
+    """
+    Convert the whole init x lead matrix, with config.yaml's settings unless
+    a config dict is given, then append it to zarr_store. Returns the
+    failures of each converted task, keyed by output label.
+    """
+    if config is not None:
+        configure(config)
+    workers = workers or convert_workers
+    make_dirs()
+    if extent:
+        print(f"📍 Applying region subsetting: {extent}")
+
+    failures = {}
+    if workers > 1:
+        for label, fails, _, _ in run_parallel(workers):
+            failures.setdefault(label, []).extend(fails)
+    else:
+        # A task that raises is recorded and the matrix carries on, as in run_task
+        for t, lead in init_lead_pairs():
+            label = output_label(t, lead)
+            try:
+                failures[label] = convert(t, lead) or []
+            except Exception as e:
+                print(f"❌ {label}: {type(e).__name__}: {e}")
+                failures[label] = [f"{type(e).__name__}: {e}"]
+
+    # Appends run in init-time order once every worker is done
+    if zarr_store:
+        for t in init_times():
+            append_to_archive(t)
+    return failures
+
+if __name__ == "__main__":
+    # Optional path to another config.yaml
+    main(load_config(sys.argv[1]) if len(sys.argv) > 1 else None)
@@ -0,0 +1,37 @@
+# gfs_actual_pipeline/plotting/plot_batch.py
+# Render several plot_driver series in one process. Series use the
+# "MAIN_VAR MAIN_LEVEL CONTOUR_VAR QUIVER" lines of run_plot_driver_array.slurm,
+# given as arguments or one per line in a file passed with --configs:
+#   python -m gfs_actual_pipeline.plotting.plot_batch "RH 700mb HGT True" "RH 500mb HGT True" --workers 4
+# Each time step is drawn for every series before the next one, so a field
+# several series share (HGT contours, UGRD/VGRD quivers) is read once.
+
+import sys
+
+from gfs_actual_pipeline.plotting import plot_driver
+
+def read_configs(args):
+    lines = []
+    if "--configs" in args:
+        i = args.index("--configs")
+        with open(args[i + 1]) as f:
+            lines += [line.strip() for line in f if line.strip() and not line.startswith("#")]
+        args = args[:i] + args[i + 2:]
+    return lines + args
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    workers = plot_driver.workers
+    if "--workers" in args:
+        i = args.index("--workers")
+        workers = int(args[i + 1])
+        args = args[:i] + args[i + 2:]
+
+    # Duplicate configs are drawn once
+    series_list = list(dict.fromkeys(plot_driver.parse_series(line) for line in read_configs(args)))
+    if not series_list:
+        raise SystemExit("No plot configs given")
+    fields = dict.fromkeys(field for series in series_list for field in plot_driver.series_fields(series))
+    print(f"📋 {len(series_list)} series share {len(fields)} fields: "
+          + ", ".join(f"{var} {level}" for var, level in fields))
+    plot_driver.main(series_list, workers)
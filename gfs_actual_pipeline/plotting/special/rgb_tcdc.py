@@ -1,4 +1,4 @@
-# gfs_forecasted_pipeline/plotting/special/rgb_tcdc.py
+# gfs_actual_pipeline/plotting/special/rgb_tcdc.py
 
 import os
 import numpy as np
@@ -6,18 +6,24 @@ import xarray as xr
 import matplotlib.pyplot as plt
 from datetime import datetime, timedelta
 
-from gfs_forecasted_pipeline.plotting.utils import setup_map, create_output_dir
+from gfs_actual_pipeline.plotting.utils import setup_map, create_output_dir
 
 # === CONFIGURATION ===
 data_dir = "/ocean/projects/atm200005p/esohn1/gfsum_master/data/gfs_actual/processed_netcdf"
 output_dir = "/ocean/projects/atm200005p/esohn1/gfsum_master/plots/gfs_actual/rgb_tcdc"
-create_output_dir(output_dir)
 
 start_time = datetime(2025, 7, 16, 0)
 end_time = datetime(2025, 7, 21, 18)
 time_step = timedelta(hours=6)
 
-for init_time in [start_time + i*time_step for i in range(int((end_time - start_time) / time_step) + 1)]:
+def init_times(start_time, end_time):
+    return [start_time + i*time_step for i in range(int((end_time - start_time) / time_step) + 1)]
+
+def plot_rgb_tcdc(init_time, data_dir=data_dir, output_dir=output_dir):
+    """
+    Layered low/mid/high cloud cover with MSLP contours for one init time.
+    Returns the saved path, or None if an input file is missing.
+    """
     timestamp = init_time.strftime("%Y%m%d_t%Hz")
 
     lcdc_path = os.path.join(data_dir, timestamp, "LCDC.nc")
@@ -27,22 +33,25 @@ for init_time in [start_time + i*time_step for i in range(int((end_time - start_
 
     if not all(os.path.exists(p) for p in [lcdc_path, mcdc_path, hcdc_path, pres_path]):
         print(f"⚠️ Missing one or more files for {timestamp}, skipping.")
-        continue
-
+        return None
+
+    # Load data
+    with xr.open_dataset(lcdc_path) as ds:
+        lcdc = ds["LCDC_lowcloudlayer"].squeeze().load()
+    with xr.open_dataset(mcdc_path) as ds:
+        mcdc = ds["MCDC_middlecloudlayer"].squeeze().load()
+    with xr.open_dataset(hcdc_path) as ds:
+        hcdc = ds["HCDC_highcloudlayer"].squeeze().load()
+    with xr.open_dataset(pres_path) as ds:
+        pres = ds["PRES_surface"].squeeze() / 100  # Pa → hPa
+
+    lon = lcdc["longitude"].values
+    lat = lcdc["latitude"].values
+    lon2d, lat2d = np.meshgrid(lon, lat)
+
+    # Set up map
+    fig, ax, proj = setup_map()
     try:
-        # Load data
-        lcdc = xr.open_dataset(lcdc_path)["LCDC_lowcloudlayer"].squeeze()
-        mcdc = xr.open_dataset(mcdc_path)["MCDC_middlecloudlayer"].squeeze()
-        hcdc = xr.open_dataset(hcdc_path)["HCDC_highcloudlayer"].squeeze()
-        pres = xr.open_dataset(pres_path)["PRES_surface"].squeeze() / 100  # Pa → hPa
-
-        lon = lcdc["longitude"].values
-        lat = lcdc["latitude"].values
-        lon2d, lat2d = np.meshgrid(lon, lat)
-
-        # Set up map
-        fig, ax, proj = setup_map()
-
         # Cloud layer shading
         p3 = ax.pcolormesh(lon2d, lat2d, lcdc, cmap="Blues", vmin=0, vmax=1, alpha=0.3, transform=proj)
         p2 = ax.pcolormesh(lon2d, lat2d, mcdc, cmap="YlGn", vmin=0, vmax=1, alpha=0.3, transform=proj)
@@ -64,7 +73,7 @@ for init_time in [start_time + i*time_step for i in range(int((end_time - start_
             fontsize=13
         )
 
-# Manually stacked vertical colorbars (narrow column on the right)
+        # Manually stacked vertical colorbars (narrow column on the right)
         cbar_ax1 = fig.add_axes([0.92, 0.65, 0.015, 0.20])  # [left, bottom, width, height]
         cbar_ax2 = fig.add_axes([0.92, 0.42, 0.015, 0.20])
         cbar_ax3 = fig.add_axes([0.92, 0.19, 0.015, 0.20])
@@ -81,7 +90,22 @@ for init_time in [start_time + i*time_step for i in range(int((end_time - start_
         # Save
         fname = f"dlr_combined_{timestamp}.png"
         plt.savefig(os.path.join(output_dir, fname), dpi=150, bbox_inches="tight")
-        plt.close()
-
-    except Exception as e:
-        print(f"❌ Failed to plot RGB cloud cover for {timestamp}: {e}")
+    finally:
+        plt.close(fig)
+    return os.path.join(output_dir, fname)
+
+def main(data_dir=data_dir, output_dir=output_dir, start_time=start_time, end_time=end_time):
+    create_output_dir(output_dir)
+    saved = []
+    for init_time in init_times(start_time, end_time):
+        try:
+            path = plot_rgb_tcdc(init_time, data_dir, output_dir)
+        except Exception as e:
+            print(f"❌ Failed to plot RGB cloud cover for {init_time:%Y%m%d_t%Hz}: {e}")
+            continue
+        if path:
+            saved.append(path)
+    return saved
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import os
+from collections import OrderedDict
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
@@ -9,6 +10,31 @@ import matplotlib.ticker as mticker
 
 from gfs_actual_pipeline.plotting.color_config import COLOR_CONFIG
 
+# === Dataset cache ===
+# load_main_variable results stay open between calls, keyed by
+# (source, var, level, file), so a frame loop opens each file once. Past
+# DATASET_CACHE_SIZE entries the least recently used one is closed.
+cache_size = int(os.getenv("DATASET_CACHE_SIZE", "16"))
+dataset_cache = OrderedDict()
+
+def cached(key, load):
+    if key in dataset_cache:
+        dataset_cache.move_to_end(key)
+        return dataset_cache[key]
+    ds = dataset_cache[key] = load()
+    while len(dataset_cache) > cache_size:
+        dataset_cache.popitem(last=False)[1].close()
+    return ds
+
+def clear_cache():
+    while dataset_cache:
+        dataset_cache.popitem()[1].close()
+
+def closing(result, *sources):
+    # Closing a dataset derived from open files closes those files
+    result.set_close(lambda: [src.close() for src in sources])
+    return result
+
 def create_output_dir(path):
     if not os.path.exists(path):
         os.makedirs(path)
@@ -34,6 +60,47 @@ def setup_map():
 
     return fig, ax, proj
 
+# === Map template ===
+class MapTemplate:
+    """
+    One figure reused for every frame of a (var, level) series. The map
+    background, shaded mesh and colorbar are built once; each frame swaps the
+    mesh data, redraws the overlays (contours, labels, quivers) and saves.
+    """
+    def __init__(self, lon, lat, cmap, bounds, label):
+        self.fig, self.ax, self.proj = setup_map()
+        self.lon, self.lat = np.asarray(lon), np.asarray(lat)
+        lon2d, lat2d = np.meshgrid(self.lon, self.lat)
+        self.mesh = self.ax.pcolormesh(
+            lon2d, lat2d, np.zeros(lon2d.shape),
+            cmap=cmap, shading="auto", transform=self.proj,
+            vmin=bounds[0], vmax=bounds[-1]
+        )
+        cbar = self.fig.colorbar(self.mesh, ax=self.ax, orientation="vertical", pad=0.02, aspect=30)
+        cbar.set_label(label)
+        self.overlays = []
+
+    def fits(self, lon, lat):
+        return np.array_equal(self.lon, np.asarray(lon)) and np.array_equal(self.lat, np.asarray(lat))
+
+    def update(self, data):
+        for artist in self.overlays:
+            artist.remove()
+        self.overlays = []
+        self.mesh.set_array(np.ma.masked_invalid(np.asarray(data)))
+
+    def add(self, artist):
+        if artist is not None:
+            self.overlays.append(artist)
+        return artist
+
+    def save(self, title, path):
+        self.ax.set_title(title, fontsize=16)
+        self.fig.savefig(path, dpi=150, bbox_inches="tight")
+
+    def close(self):
+        plt.close(self.fig)
+
 def plot_quivers(ax, u, v, lat, lon, proj, stride=10, scale=500):
     try:
         # Ensure same shape for u and v
@@ -85,45 +152,61 @@ def calculate_potential_temperature(temp, pressure):
     theta = temp * (p0 / pressure) ** kappa
     return theta
 
-def load_main_variable(var, level, timestamp):
-    base_dir = "/ocean/projects/atm200005p/esohn1/gfsum_master/data/gfs_forecasted/processed_netcdf"
+def select_level(ds, var, level):
+    # Stacked layout: VAR(time, pressure, lat, lon); per-level layout: VAR_700mb
+    if var in ds and "pressure" in ds[var].dims and level.endswith("mb"):
+        return ds[var].sel(pressure=int(level.replace("mb", "")))
+    if f"{var}_{level}" in ds:
+        return ds[f"{var}_{level}"]
+    return None
+
+base_dir = "/ocean/projects/atm200005p/esohn1/gfsum_master/data/gfs_actual/processed_netcdf"
+
+def load_main_variable(var, level, timestamp, data_dir=base_dir):
     if isinstance(timestamp, np.datetime64):
         timestamp_str = str(np.datetime_as_string(timestamp, unit="s")).replace(":", "")
     else:
         timestamp_str = str(timestamp)
-    timestamp_dir = os.path.join(base_dir, timestamp_str)
+    timestamp_dir = os.path.join(data_dir, timestamp_str)
+
+    # Potential temperature is computed from TMP.nc
+    file_path = os.path.join(timestamp_dir, "TMP.nc" if var == "POT" else f"{var}.nc")
+    return cached(("gfs_actual", var, level, file_path), lambda: open_main_variable(var, level, file_path))
+
+def open_main_variable(var, level, file_path):
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"NetCDF file not found: {file_path}")
+    ds = xr.open_dataset(file_path)
 
     # Special case: Potential temperature
     if var == "POT":
-        tmp_ds = xr.open_dataset(os.path.join(timestamp_dir, "TMP.nc"))
         pressure_pa = int(level.replace("mb", "")) * 100
-        tmp_var = f"TMP_{level}"
-        if tmp_var not in tmp_ds:
-            raise KeyError(f"Missing {tmp_var} in TMP.nc")
-        temperature = tmp_ds[tmp_var]
+        temperature = select_level(ds, "TMP", level)
+        if temperature is None:
+            ds.close()
+            raise KeyError(f"Missing TMP at {level} in TMP.nc")
         pot = calculate_potential_temperature(temperature, pressure_pa)
         pot.attrs = temperature.attrs
-        return pot.to_dataset(name=f"{var}_{level}")
+        return closing(pot.to_dataset(name=f"{var}_{level}"), ds)
 
-    file_path = os.path.join(timestamp_dir, f"{var}.nc")
-    if not os.path.exists(file_path):
-        raise FileNotFoundError(f"NetCDF file not found: {file_path}")
-
-    ds = xr.open_dataset(file_path)
     if var == "HPBL" and level == "surface":
         var_name = "HPBL_surface" if "HPBL_surface" in ds else "HPBL"
+        data = ds[var_name] if var_name in ds else None
     else:
-        var_name = f"{var}_{level}" if f"{var}_{level}" in ds else var
+        var_name = f"{var}_{level}"
+        data = select_level(ds, var, level)
+        if data is None and var in ds:
+            var_name, data = var, ds[var]
 
-    if var_name not in ds:
+    if data is None:
+        ds.close()
         raise KeyError(f"Variable {var_name} not found in {file_path}")
 
-    data = ds[var_name]
-
     # === Manual conversions for specific variables ===
+    # (not in place: the file's own arrays must stay in their units)
     if var == "RH" and data.max() < 1.5:
-        data *= 100  # Convert from [0–1] to [%]
+        data = (data * 100).assign_attrs(data.attrs)  # Convert from [0–1] to [%]
     elif var == "LWC":
-        data *= 1000  # Convert from kg/m³ to g/m³
+        data = (data * 1000).assign_attrs(data.attrs)  # Convert from kg/m³ to g/m³
 
-    return data.to_dataset(name=var_name)
\ No newline at end of file
+    return closing(data.to_dataset(name=var_name), ds)
\ No newline at end of file
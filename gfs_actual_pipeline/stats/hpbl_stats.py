@@ -3,32 +3,42 @@ import os
 import xarray as xr
 import pandas as pd
 
+from gfs_actual_pipeline.download import convert
+
 source = "gfs_actual"
 dates = pd.date_range("2025-07-16", "2025-07-21", freq="D")
 base_dir = f"/ocean/projects/atm200005p/esohn1/gfsum_master/data/{source}/processed_netcdf"
 output_csv = f"/ocean/projects/atm200005p/esohn1/gfsum_master/stats/{source}/hpbl_summary.csv"
-os.makedirs(os.path.dirname(output_csv), exist_ok=True)
-
-records = []
-for date in dates:
-    timestamp = date.strftime("%Y%m%d")
-    try:
-        path = os.path.join(base_dir, f"{timestamp}_t00z/HPBL.nc")
-        ds = xr.open_dataset(path)
-        hpbl = list(ds.data_vars.values())[0]
-
-        records.append({
-            "date": date.strftime("%Y-%m-%d"),
-            "mean_HPBL_m": float(hpbl.mean().values),
-            "min_HPBL_m": float(hpbl.min().values),
-            "max_HPBL_m": float(hpbl.max().values)
-        })
-
-    except FileNotFoundError:
-        print(f"⚠️ Missing data for {timestamp}")
-        continue
-
-df = pd.DataFrame(records)
-df.to_csv(output_csv, index=False)
-print(f"✅ Saved HPBL summary to {output_csv}")
 
+def main(base_dir=base_dir, output_csv=output_csv, dates=dates, lead=None):
+    os.makedirs(os.path.dirname(output_csv), exist_ok=True)
+
+    # 00z directories as convert.py names them, for the first configured lead unless given
+    lead = convert.forecast_hours[0] if lead is None else lead
+
+    records = []
+    for date in dates:
+        timestamp = convert.output_label(date, lead)
+        try:
+            path = os.path.join(base_dir, timestamp, "HPBL.nc")
+            with xr.open_dataset(path) as ds:
+                hpbl = list(ds.data_vars.values())[0]
+
+                records.append({
+                    "date": date.strftime("%Y-%m-%d"),
+                    "mean_HPBL_m": float(hpbl.mean().values),
+                    "min_HPBL_m": float(hpbl.min().values),
+                    "max_HPBL_m": float(hpbl.max().values)
+                })
+
+        except FileNotFoundError:
+            print(f"⚠️ Missing data for {timestamp}")
+            continue
+
+    df = pd.DataFrame(records)
+    df.to_csv(output_csv, index=False)
+    print(f"✅ Saved HPBL summary to {output_csv}")
+    return df
+
+if __name__ == "__main__":
+    main()
@@ -1,43 +1,432 @@
 # === download.py ===
 import os
+import sys
+import time
 import yaml
+import shutil
+import hashlib
+import sqlite3
+import threading
+import contextlib
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
-with open(os.path.join(os.path.dirname(__file__), "../config.yaml")) as f:
-    config = yaml.safe_load(f)
+config_path = os.path.join(os.path.dirname(__file__), "../config.yaml")
+chunk_size = 1024 * 1024
 
-start_time = datetime.strptime(config["start_time"], "%Y-%m-%d %H:%M")
-end_time = datetime.strptime(config["end_time"], "%Y-%m-%d %H:%M")
-step = timedelta(hours=config["step_hours"])
-forecast_hour = int(config["forecast_hour"])
+def load_config(path=config_path):
+    with open(path) as f:
+        return yaml.safe_load(f)
 
-raw_dir = config["raw_grib_dir"]
-os.makedirs(raw_dir, exist_ok=True)
+def parse_forecast_hours(config):
+    """
+    forecast_hours may be a list ([0, 24, 48]) or a range
+    ({start: 0, end: 120, step: 6}); a single forecast_hour still works.
+    """
+    hours = config.get("forecast_hours", config.get("forecast_hour"))
+    if isinstance(hours, dict):
+        return list(range(int(hours["start"]), int(hours["end"]) + 1, int(hours.get("step", 1))))
+    if isinstance(hours, (list, tuple)):
+        return [int(h) for h in hours]
+    return [int(hours)]
 
-def download_gfs_file(init_time):
+def configure(new_config):
+    """
+    Set the module-wide settings from a config dict. Importing applies
+    config.yaml; a long-lived process or test can call this again (e.g. with
+    {**load_config(), "raw_grib_dir": ...}) instead of re-importing.
+    Nothing is created on disk until a download runs.
+    """
+    global config, start_time, end_time, step, forecast_hours, raw_dir
+    global base_url, download_workers, max_retries, retry_backoff, subset_download, wanted_messages
+    global cache_dir, cache_max_bytes, cache_idx_max_age, session
+    config = new_config
+
+    start_time = datetime.strptime(config["start_time"], "%Y-%m-%d %H:%M")
+    end_time = datetime.strptime(config["end_time"], "%Y-%m-%d %H:%M")
+    step = timedelta(hours=config["step_hours"])
+    forecast_hours = parse_forecast_hours(config)
+    raw_dir = config["raw_grib_dir"]
+
+    # === Transfer settings ===
+    base_url = config.get("base_url", "https://noaa-gfs-bdp-pds.s3.amazonaws.com").rstrip("/")
+    download_workers = int(config.get("download_workers", 1))
+    max_retries = int(config.get("max_retries", 3))
+    retry_backoff = float(config.get("retry_backoff", 2.0))
+    subset_download = bool(config.get("subset_download", False))
+
+    # (name, level) pairs kept by convert.py, e.g. ("TMP", "700 mb")
+    wanted_messages = {(var["name"], lev) for var in config["variables"] for lev in var.get("levels", [])}
+
+    # === Shared GRIB cache ===
+    # Both GFS pipelines can point cache_dir at the same directory. Entries are
+    # keyed by URL and byte span, so a message fetched by one pipeline is reused
+    # by the other, and the least recently used entries go once cache_max_gb is hit.
+    cache_dir = config.get("cache_dir")
+    cache_max_bytes = float(config.get("cache_max_gb", 50)) * 1e9
+    # .idx inventories are refetched after this, in case one was cached mid-upload
+    cache_idx_max_age = float(config.get("cache_idx_hours", 24)) * 3600
+
+    session = make_session(download_workers)
+
+def make_dirs():
+    os.makedirs(raw_dir, exist_ok=True)
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+
+def cache_db():
+    # One short-lived connection per call: sqlite connections cannot cross threads
+    con = sqlite3.connect(os.path.join(cache_dir, "index.sqlite"), timeout=120)
+    con.execute("CREATE TABLE IF NOT EXISTS entries "
+                "(key TEXT PRIMARY KEY, url TEXT, span TEXT, size INTEGER, last_used REAL)")
+    return con
+
+def cache_key(url, span=""):
+    # span is "" for a whole file, else "start-end" ("start-" runs to EOF)
+    return hashlib.sha256(f"{url}|{span}".encode()).hexdigest()
+
+def blob_path(key):
+    return os.path.join(cache_dir, key[:2], key)
+
+def span_label(start, end):
+    return f"{start}-{end if end is not None else ''}"
+
+def cache_lookup(url, span="", max_age=None):
+    """
+    Path of the cached bytes, or None on a miss (or an entry stored more than
+    max_age seconds ago). A hit refreshes its LRU timestamp.
+    """
+    if not cache_dir:
+        return None
+    key = cache_key(url, span)
+    path = blob_path(key)
+    with contextlib.closing(cache_db()) as con, con:
+        row = con.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None or not os.path.exists(path) or os.path.getsize(path) != row[0]:
+            return None
+        if max_age is not None and time.time() - os.path.getmtime(path) > max_age:
+            return None
+        con.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+    return path
+
+def cache_read(url, span="", max_age=None):
+    path = cache_lookup(url, span, max_age)
+    if path is None:
+        return None
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except OSError:
+        # Evicted by another process since the lookup
+        return None
+
+def link_from_cache(url, out_path):
+    # Hardlink a cached whole file into raw_dir (copy across filesystems)
+    path = cache_lookup(url)
+    if path is None:
+        return False
+    try:
+        try:
+            os.link(path, out_path)
+        except OSError:
+            shutil.copyfile(path, out_path)
+    except OSError:
+        return False
+    return True
+
+def cache_store(url, span, data=None, src_path=None):
+    """
+    Add bytes (data) or a finished file (src_path, hardlinked when the cache
+    is on the same filesystem) to the cache, then evict down to the size cap.
+    """
+    if not cache_dir:
+        return
+    key = cache_key(url, span)
+    path = blob_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    if src_path is not None:
+        try:
+            os.link(src_path, tmp_path)
+        except OSError:
+            shutil.copyfile(src_path, tmp_path)
+    else:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+    os.replace(tmp_path, path)
+    with contextlib.closing(cache_db()) as con, con:
+        con.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                    (key, url, span, os.path.getsize(path), time.time()))
+    evict_cache(keep=key)
+
+_evict_lock = threading.Lock()
+
+def evict_cache(keep=None):
+    """
+    Drop least recently used entries until the cache is under cache_max_bytes.
+    A blob still hardlinked into raw_dir (st_nlink > 1) frees nothing when
+    removed, so it is neither counted nor evicted; neither is `keep`, the
+    entry just stored. Evictions run one at a time: a lock between threads,
+    an immediate sqlite transaction between processes.
+    """
+    with _evict_lock, contextlib.closing(cache_db()) as con, con:
+        con.execute("BEGIN IMMEDIATE")
+        # Cheap check first: the recorded sizes only overcount hardlinked blobs
+        if con.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0] <= cache_max_bytes:
+            return
+        footprint = {}
+        for key, size in con.execute("SELECT key, size FROM entries ORDER BY last_used").fetchall():
+            try:
+                footprint[key] = size if os.stat(blob_path(key)).st_nlink == 1 else 0
+            except OSError:
+                # Blob removed by hand; forget the entry
+                con.execute("DELETE FROM entries WHERE key = ?", (key,))
+        total = sum(footprint.values())
+        evicted = 0
+        for key, size in footprint.items():
+            if total <= cache_max_bytes:
+                break
+            if key == keep or size == 0:
+                continue
+            os.remove(blob_path(key))
+            con.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+    if evicted:
+        print(f"🧹 Cache trimmed to {total / 1e9:.1f} GB")
+
+def make_session(pool_size):
+    # One keep-alive connection pool shared by every worker thread
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+configure(load_config())
+
+def gfs_url(init_time, lead):
     date_str = init_time.strftime("%Y%m%d")
     hour_str = init_time.strftime("%H")
-    fxx = f"{forecast_hour:03d}"
-    url = (
-        f"https://noaa-gfs-bdp-pds.s3.amazonaws.com/gfs.{date_str}/{hour_str}/atmos/"
-        f"gfs.t{hour_str}z.pgrb2.0p25.f{fxx}"
-    )
-    out_path = os.path.join(raw_dir, f"gfs_{date_str}_t{hour_str}z_f{fxx}.grib2")
+    fxx = f"{lead:03d}"
+    return f"{base_url}/gfs.{date_str}/{hour_str}/atmos/gfs.t{hour_str}z.pgrb2.0p25.f{fxx}"
+
+def raw_grib_path(init_time, lead):
+    date_str = init_time.strftime("%Y%m%d")
+    hour_str = init_time.strftime("%H")
+    fxx = f"{lead:03d}"
+    return os.path.join(raw_dir, f"gfs_{date_str}_t{hour_str}z_f{fxx}.grib2")
+
+def fetch(url, out_path):
+    """
+    Stream url to out_path through a .part file, resuming with an HTTP Range
+    request after a dropped connection. Returns the number of bytes received,
+    or None if the file could not be fetched.
+    """
+    part_path = out_path + ".part"
+    # Bytes already in the .part file from an earlier run are not counted
+    start_offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    for attempt in range(1, max_retries + 1):
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        # Only bytes that made it into the .part file count towards this run
+        received = max(offset - start_offset, 0)
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        try:
+            with session.get(url, headers=headers, stream=True, timeout=60) as r:
+                if r.status_code == 416 and offset:
+                    # The partial file already holds every byte
+                    os.replace(part_path, out_path)
+                    return received
+                if r.status_code == 404:
+                    print(f"❌ Failed: {url} (404)")
+                    return None
+                r.raise_for_status()
+
+                # A 200 means the server ignored the Range header, so start over
+                mode = "ab" if r.status_code == 206 else "wb"
+                if offset and mode == "ab":
+                    print(f"↪️ Resuming {os.path.basename(out_path)} from byte {offset}")
+                if mode == "wb":
+                    start_offset, received = 0, 0
+                with open(part_path, mode) as f:
+                    for chunk in r.iter_content(chunk_size=chunk_size):
+                        f.write(chunk)
+                        received += len(chunk)
+            os.replace(part_path, out_path)
+            return received
+        except (requests.RequestException, OSError) as e:
+            if attempt == max_retries:
+                print(f"❌ Failed: {url} after {max_retries} attempts ({e})")
+                return None
+            wait = retry_backoff ** attempt
+            print(f"⚠️ Attempt {attempt}/{max_retries} failed for {url}: {e} — retrying in {wait:.0f}s")
+            time.sleep(wait)
+    return None
+
+def get_bytes(url, headers=None):
+    # Small in-memory GET with the same retry policy as fetch()
+    for attempt in range(1, max_retries + 1):
+        try:
+            r = session.get(url, headers=headers or {}, timeout=60)
+            if r.status_code == 404:
+                print(f"❌ Failed: {url} (404)")
+                return None
+            r.raise_for_status()
+            return r
+        except requests.RequestException as e:
+            if attempt == max_retries:
+                print(f"❌ Failed: {url} after {max_retries} attempts ({e})")
+                return None
+            wait = retry_backoff ** attempt
+            print(f"⚠️ Attempt {attempt}/{max_retries} failed for {url}: {e} — retrying in {wait:.0f}s")
+            time.sleep(wait)
+    return None
+
+def parse_idx(text):
+    """
+    Parse a wgrib2-style inventory ("1:0:d=2025071400:TMP:700 mb:48 hour fcst:")
+    into records with the byte span of each message. The last message has
+    end=None, meaning it runs to the end of the file.
+    """
+    records = []
+    for line in text.splitlines():
+        fields = line.split(":")
+        if len(fields) < 5:
+            continue
+        records.append({"msg": fields[0], "start": int(fields[1]), "name": fields[3], "level": fields[4]})
+
+    # Sub-messages (e.g. "12.1", "12.2") share an offset, so a message ends
+    # just before the next record that starts further into the file
+    offsets = sorted({rec["start"] for rec in records})
+    next_offset = dict(zip(offsets, offsets[1:] + [None]))
+    for rec in records:
+        nxt = next_offset[rec["start"]]
+        rec["end"] = nxt - 1 if nxt is not None else None
+    return records
+
+def merge_ranges(ranges):
+    # Coalesce touching or overlapping (start, end) spans; end=None means EOF
+    merged = []
+    for start, end in sorted(set(ranges)):
+        if merged and (merged[-1][1] is None or start <= merged[-1][1] + 1):
+            prev_start, prev_end = merged[-1]
+            merged[-1] = (prev_start, None if prev_end is None or end is None else max(prev_end, end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def fetch_subset(url, out_path):
+    """
+    Fetch only the GRIB messages listed under `variables` in config.yaml.
+    Whole GRIB2 messages concatenate into a valid GRIB2 file, so the message
+    byte spans are written back to back into out_path. With cache_dir set,
+    each message is cached on its own and only the misses hit the network.
+    Returns the number of bytes fetched from the network.
+    """
+    idx_url = url + ".idx"
+    idx = cache_read(idx_url, max_age=cache_idx_max_age)
+    if idx is None:
+        r = get_bytes(idx_url)
+        if r is None:
+            return None
+        idx = r.content
+        cache_store(idx_url, "", data=idx)
+    records = parse_idx(idx.decode())
+    selected = [rec for rec in records if (rec["name"], rec["level"]) in wanted_messages]
+    if not selected:
+        print(f"❌ None of the configured variables found in {url}.idx")
+        return None
+
+    # Sub-messages share a span, so each span is fetched and written once
+    spans = sorted({(rec["start"], rec["end"]) for rec in selected})
+    pieces = {}
+    for span in spans:
+        data = cache_read(url, span_label(*span))
+        if data is not None:
+            pieces[span] = data
+    missing = [span for span in spans if span not in pieces]
+    ranges = merge_ranges(missing)
+    print(f"✂️ Subsetting {len(selected)}/{len(records)} messages: "
+          f"{len(spans) - len(missing)} spans cached, {len(ranges)} byte ranges to fetch")
+
+    received = 0
+    for start, end in ranges:
+        r = get_bytes(url, headers={"Range": f"bytes={span_label(start, end)}"})
+        if r is None:
+            return None
+        # A 200 means the server ignored the Range header
+        data = r.content if r.status_code == 206 else r.content[start:None if end is None else end + 1]
+        received += len(data)
+        # Split the merged range back into per-message pieces
+        for span in missing:
+            if start <= span[0] and (end is None or (span[1] is not None and span[1] <= end)):
+                piece = data[span[0] - start:None if span[1] is None else span[1] - start + 1]
+                pieces[span] = piece
+                cache_store(url, span_label(*span), data=piece)
+
+    part_path = out_path + ".part"
+    with open(part_path, "wb") as f:
+        for span in spans:
+            f.write(pieces[span])
+    os.replace(part_path, out_path)
+    return received
+
+def download_gfs_file(init_time, lead):
+    url = gfs_url(init_time, lead)
+    out_path = raw_grib_path(init_time, lead)
     if os.path.exists(out_path):
         print(f"✅ Already exists: {out_path}")
-        return
+        return 0
+    if not subset_download and link_from_cache(url, out_path):
+        print(f"📚 From cache: {out_path}")
+        return 0
+
     print(f"⬇️ Downloading: {url}")
-    r = requests.get(url, stream=True)
-    if r.status_code == 200:
-        with open(out_path, "wb") as f:
-            for chunk in r.iter_content(chunk_size=8192):
-                f.write(chunk)
+    received = fetch_subset(url, out_path) if subset_download else fetch(url, out_path)
+    if received is not None:
+        if not subset_download:
+            cache_store(url, "", src_path=out_path)
         print(f"✅ Saved: {out_path}")
-    else:
-        print(f"❌ Failed: {url} ({r.status_code})")
+    return received
+
+def init_times():
+    current = start_time
+    while current <= end_time:
+        yield current
+        current += step
+
+def init_lead_pairs():
+    # The full init x lead matrix; every file shares one worker pool
+    return [(t, lead) for t in init_times() for lead in forecast_hours]
+
+def main(config=None, workers=None):
+    """
+    Download the whole init x lead matrix, with config.yaml's settings unless
+    a config dict is given. Returns the bytes received per file (None where
+    a file failed).
+    """
+    global session
+    if config is not None:
+        configure(config)
+    workers = workers or download_workers
+    make_dirs()
+    # One pooled connection per worker thread actually used
+    session = make_session(workers)
+
+    t0 = time.time()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(download_gfs_file, *zip(*init_lead_pairs())))
+    elapsed = max(time.time() - t0, 1e-6)
+
+    total_bytes = sum(r for r in results if r)
+    n_failed = sum(r is None for r in results)
+    print(f"\n📊 {len(results) - n_failed}/{len(results)} files ok, "
+          f"{total_bytes / 1e6:.1f} MB in {elapsed:.1f}s "
+          f"({total_bytes / 1e6 / elapsed:.1f} MB/s with {workers} workers)")
+    return results
 
-current = start_time
-while current <= end_time:
-    download_gfs_file(current)
-    current += step
+if __name__ == "__main__":
+    # Optional path to another config.yaml
+    main(load_config(sys.argv[1]) if len(sys.argv) > 1 else None)
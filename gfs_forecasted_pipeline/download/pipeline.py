@@ -0,0 +1,125 @@
+# === pipeline.py ===
+# Download and convert in one job: each GRIB file is queued for conversion as
+# soon as its download finishes, so network and CPU time overlap.
+import os
+import sys
+import json
+import time
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import download
+import convert
+
+def wanted_outputs():
+    # Levels, extent, layout and backend of every output, as in convert.py's manifests
+    return {var["name"]: convert.output_settings(var) for var in convert.variables}
+
+def already_converted(init_time, lead):
+    # A raw file deleted after a clean conversion leaves a <grib>.converted marker,
+    # which only counts while the conversion settings are unchanged
+    marker = download.raw_grib_path(init_time, lead) + ".converted"
+    if not os.path.exists(marker):
+        return False
+    with open(marker) as f:
+        return json.load(f) == wanted_outputs()
+
+def fetch_one(init_time, lead):
+    if not os.path.exists(download.raw_grib_path(init_time, lead)) and already_converted(init_time, lead):
+        print(f"⏭️ Already converted: {init_time:%Y%m%d_t%Hz} f{lead:03d}")
+        return 0
+    return download.download_gfs_file(init_time, lead)
+
+def remove_raw(init_time, lead):
+    grib_file = download.raw_grib_path(init_time, lead)
+    if not os.path.exists(grib_file):
+        return
+    with open(grib_file + ".converted", "w") as f:
+        json.dump(wanted_outputs(), f)
+    for path in (grib_file, grib_file + ".inv"):
+        if os.path.exists(path):
+            os.remove(path)
+    print(f"🗑️ Removed {grib_file}")
+
+def main(config=None):
+    """
+    Download and convert the whole init x lead matrix, with config.yaml's
+    settings unless a config dict is given. Returns the conversion results.
+    """
+    if config is not None:
+        download.configure(config)
+        convert.configure(config)
+    download.make_dirs()
+    convert.make_dirs()
+    if convert.extent:
+        print(f"📍 Applying region subsetting: {convert.extent}")
+    delete_raw = bool(convert.config.get("delete_raw_after_convert", False))
+
+    t0 = time.time()
+    n_workers = max(convert.convert_workers, 1)
+    print(f"🚀 Pipelining {download.download_workers} download and {n_workers} conversion workers")
+
+    received, results, dl_failed = [], [], []
+    # Conversion workers are spawned, not forked, while download threads are running
+    with ThreadPoolExecutor(max_workers=download.download_workers) as dl_pool, \
+            ProcessPoolExecutor(max_workers=n_workers, mp_context=multiprocessing.get_context("spawn"),
+                                initializer=convert.configure, initargs=(convert.config,)) as cv_pool:
+        downloads = {dl_pool.submit(fetch_one, t, lead): (t, lead) for t, lead in download.init_lead_pairs()}
+        conversions = {}
+        pending = set(downloads)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in downloads:
+                    init_time, lead = downloads[future]
+                    try:
+                        nbytes = future.result()
+                    except Exception as e:
+                        # e.g. an OSError from the cache; the other files carry on
+                        print(f"❌ Download failed: {init_time:%Y%m%d_t%Hz} f{lead:03d} ({type(e).__name__}: {e})")
+                        nbytes = None
+                    received.append(nbytes)
+                    if nbytes is None:
+                        dl_failed.append(f"{init_time:%Y%m%d_t%Hz} f{lead:03d}")
+                    # Files skipped as already converted have no raw GRIB to convert
+                    if nbytes is not None and os.path.exists(download.raw_grib_path(init_time, lead)):
+                        cv_future = cv_pool.submit(convert.run_task, init_time, lead)
+                        conversions[cv_future] = (init_time, lead)
+                        pending.add(cv_future)
+                    continue
+
+                init_time, lead = conversions[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # run_task reports its own errors; this is the worker process itself failing
+                    error = f"{type(e).__name__}: {e}"
+                    result = (convert.output_label(init_time, lead), [error], 0.0, error)
+                label, failures, elapsed, log = result
+                results.append(result)
+                print(f"{'❌' if failures else '✅'} Converted {label} ({elapsed:.1f}s)")
+                # Failed conversions keep their raw file for the next run
+                if delete_raw and not failures:
+                    remove_raw(init_time, lead)
+
+    # Appends run in init-time order once every worker is done
+    if convert.zarr_store:
+        for t in convert.init_times():
+            convert.append_to_archive(t)
+
+    elapsed = max(time.time() - t0, 1e-6)
+    total_bytes = sum(r for r in received if r)
+    n_dl_failed = len(dl_failed)
+    failed = sorted((r for r in results if r[1]), key=lambda r: r[0])
+    print(f"\n📊 {len(received) - n_dl_failed}/{len(received)} files downloaded "
+          f"({total_bytes / 1e6:.1f} MB), {len(results) - len(failed)}/{len(results)} converted "
+          f"in {elapsed:.1f}s")
+    if dl_failed:
+        print(f"\n❌ Not downloaded: {', '.join(sorted(dl_failed))}")
+    for label, _, _, log in failed:
+        print(f"\n❌ {label}:\n{log.rstrip()}")
+    return results
+
+if __name__ == "__main__":
+    # Optional path to another config.yaml
+    main(convert.load_config(sys.argv[1]) if len(sys.argv) > 1 else None)
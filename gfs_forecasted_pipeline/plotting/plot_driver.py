@@ -1,13 +1,18 @@
 # gfs_forecasted_pipeline/plotting/plot_driver.py
 
 import os
+import sys
 import numpy as np
 import xarray as xr
-import matplotlib.pyplot as plt
+import matplotlib
+matplotlib.use("Agg")
 import pandas as pd
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 
+from gfs_forecasted_pipeline.plotting import utils
 from gfs_forecasted_pipeline.plotting.utils import (
-    setup_map, format_title, plot_quivers, load_main_variable, get_lon_lat
+    MapTemplate, format_title, plot_quivers, load_main_variable, get_lon_lat
 )
 from gfs_forecasted_pipeline.plotting.color_config import COLOR_CONFIG, CONTOUR_CONFIG
 
@@ -18,52 +23,73 @@ contour_var = os.getenv("CONTOUR_VAR", None)
 if contour_var in ["None", ""]:
     contour_var = None
 quiver = os.getenv("QUIVER", "False") == "True"
+# Reuse one figure for the whole series; REUSE_MAP=False builds a new map every frame
+reuse_map = os.getenv("REUSE_MAP", "True") == "True"
+# Frames rendered in parallel (overridden by --workers N)
+workers = int(os.getenv("PLOT_WORKERS", "1"))
 forecast_hour = 48
 base_dir = "/ocean/projects/atm200005p/esohn1/gfsum_master/data/gfs_forecasted/processed_netcdf"
-
-# === Load plotting config ===
-config = COLOR_CONFIG[main_var]
-cmap = config["cmap"]
-bounds = config["bounds"]
-label = config["label"]
-
-# === Loop through timestamps ===
-timestamp_dirs = sorted(os.listdir(base_dir))
-if not timestamp_dirs:
-    raise FileNotFoundError(f"No timestamp directories found in {base_dir}")
-
-for timestamp_str in timestamp_dirs:
+plot_dir = "/ocean/projects/atm200005p/esohn1/gfsum_master/plots/gfs_forecasted"
+
+# Map templates of this process, one per series, built by its first frame
+templates = {}
+# Fields of the timestamp being drawn, shared by every series that uses them
+frame_fields = {}
+
+def parse_series(text):
+    """
+    "RH 700mb HGT True" -> ("RH", "700mb", "HGT", True), the
+    MAIN_VAR MAIN_LEVEL CONTOUR_VAR QUIVER format of run_plot_driver_array.slurm.
+    """
+    var, level, contour, use_quiver = text.split()
+    return var, level, None if contour in ["None", ""] else contour, use_quiver == "True"
+
+def series_fields(series):
+    var, level, contour, use_quiver = series
+    fields = [(var, level)]
+    if contour:
+        fields.append((contour, level))
+    if use_quiver:
+        fields += [("UGRD", level), ("VGRD", level)]
+    return fields
+
+def frame_field(var, level, timestamp_str, data_dir=base_dir):
+    # Read once per timestamp, however many series plot it
+    key = (var, level, timestamp_str)
+    if key not in frame_fields:
+        ds = load_main_variable(var, level, timestamp_str, data_dir)
+        var_name = f"{var}_{level}" if f"{var}_{level}" in ds else var
+        if var_name not in ds:
+            var_name = list(ds.data_vars)[0] if var in ["UGRD", "VGRD"] else None
+        frame_fields[key] = ds[var_name].squeeze().load() if var_name else None
+    return frame_fields[key]
+
+def render_frame(series, timestamp_str, data_dir=base_dir, plot_dir=plot_dir):
+    main_var, main_level, contour_var, quiver = series
     print(f"\n🔄 Plotting {main_var} at {main_level} — {timestamp_str}")
-    timestamp_path = os.path.join(base_dir, timestamp_str)
+    config = COLOR_CONFIG[main_var]
 
     # Load main variable
-    ds = load_main_variable(main_var, main_level, timestamp_str)
-    var_name = f"{main_var}_{main_level}" if f"{main_var}_{main_level}" in ds else main_var
-    data = ds[var_name].squeeze()
+    data = frame_field(main_var, main_level, timestamp_str, data_dir)
+    if data is None:
+        raise KeyError(f"{main_var} at {main_level} not found for {timestamp_str}")
 
-    # Plot setup
-    fig, ax, proj = setup_map()
+    # Plot setup: the map is only rebuilt when the grid changes
     lon, lat = get_lon_lat(data)
-    lon2d, lat2d = np.meshgrid(lon, lat)
-
-    mesh = ax.pcolormesh(
-        lon2d, lat2d, data,
-        cmap=cmap,
-        shading="auto",
-        transform=proj,
-        vmin=bounds[0],
-        vmax=bounds[-1]
-    )
+    template = templates.get(series)
+    if template is None or not reuse_map or not template.fits(lon, lat):
+        if template is not None:
+            template.close()
+        template = templates[series] = MapTemplate(lon, lat, config["cmap"], config["bounds"], config["label"])
+    template.update(data)
+    ax, proj = template.ax, template.proj
 
     # === Contour overlay ===
     if contour_var:
-        ds_contour = load_main_variable(contour_var, main_level, timestamp_str)
-        contour_var_name = f"{contour_var}_{main_level}" if f"{contour_var}_{main_level}" in ds_contour else contour_var
-
-        if contour_var_name not in ds_contour:
-            print(f"⚠️ {contour_var_name} not found in dataset for {timestamp_str}. Skipping contour overlay.")
+        contour_data = frame_field(contour_var, main_level, timestamp_str, data_dir)
+        if contour_data is None:
+            print(f"⚠️ {contour_var} not found in dataset for {timestamp_str}. Skipping contour overlay.")
         else:
-            contour_data = ds_contour[contour_var_name].squeeze()
             style = CONTOUR_CONFIG.get((main_var, contour_var), {})
 
             lon_c, lat_c = get_lon_lat(contour_data)
@@ -73,40 +99,82 @@ for timestamp_str in timestamp_dirs:
             vmin = np.nanmin(contour_data)
             vmax = np.nanmax(contour_data)
             contour_levels = np.linspace(vmin, vmax, 60)
-            cs = ax.contour(lon2d_c, lat2d_c, contour_data, levels=contour_levels, transform=proj, **style)
+            cs = template.add(ax.contour(lon2d_c, lat2d_c, contour_data, levels=contour_levels, transform=proj, **style))
             ax.clabel(cs, inline=1, fontsize=8, fmt="%d")
 
     # === Quiver overlay ===
     if quiver:
-        u_ds = load_main_variable("UGRD", main_level, timestamp_str)
-        v_ds = load_main_variable("VGRD", main_level, timestamp_str)
-        
-        u_var = list(u_ds.data_vars)[0]
-        u = u_ds[u_var].squeeze()
-        v_var = list(v_ds.data_vars)[0]
-        v = v_ds[v_var].squeeze()
+        u = frame_field("UGRD", main_level, timestamp_str, data_dir)
+        v = frame_field("VGRD", main_level, timestamp_str, data_dir)
         lon_q, lat_q = get_lon_lat(u)
-        plot_quivers(ax, u.values, v.values, lat_q, lon_q, proj)
+        template.add(plot_quivers(ax, u.values, v.values, lat_q, lon_q, proj))
 
-    # === Title + Colorbar ===
-    date_str = timestamp_str.split("_t")[0]
-    hour_str = timestamp_str.split("_t")[1].replace("z", "")
+    # === Title ===
+    # Lead-time matrix runs name directories <date>_t<HH>z_f<FFF>
+    date_str, cycle_str = timestamp_str.split("_t")
+    hour_str, _, lead_str = cycle_str.partition("z")
+    lead_hours = int(lead_str.lstrip("_f")) if lead_str else forecast_hour
     init_time_str = f"{date_str[:4]}-{date_str[4:6]}-{date_str[6:]}T{hour_str}:00"
     init_time = pd.to_datetime(init_time_str)
-    valid_time = np.datetime64(init_time + pd.Timedelta(hours=forecast_hour))
+    valid_time = np.datetime64(init_time + pd.Timedelta(hours=lead_hours))
 
     title = format_title(main_var, main_level, valid_time, contour_var, np.datetime64(init_time))
-    plt.title(title, fontsize=16)
-    cbar = plt.colorbar(mesh, ax=ax, orientation="vertical", pad=0.02, aspect=30)
-    cbar.set_label(label)
 
     # === Save figure ===
-    out_dir = f"/ocean/projects/atm200005p/esohn1/gfsum_master/plots/gfs_forecasted/{main_var}/{main_level}"
-    if contour_var:
-        out_dir = out_dir.replace(main_var, f"{main_var}_{contour_var}")
+    out_dir = os.path.join(plot_dir, f"{main_var}_{contour_var}" if contour_var else main_var, main_level)
     os.makedirs(out_dir, exist_ok=True)
 
     fname = f"{main_var}_{main_level}_{timestamp_str}.png" if not contour_var else f"{main_var}_{contour_var}_{main_level}_{timestamp_str}.png"
     print(f"💾 Saving to {os.path.join(out_dir, fname)}")
-    plt.savefig(os.path.join(out_dir, fname), dpi=150, bbox_inches="tight")
-    plt.close()
+    template.save(title, os.path.join(out_dir, fname))
+    return os.path.join(out_dir, fname)
+
+def render_frames(series_list, timestamp_dirs, data_dir=base_dir, plot_dir=plot_dir):
+    """
+    One worker's block of consecutive timestamps. Every series is drawn for a
+    timestamp before moving on, so fields they share are read once.
+    """
+    # Keep every field of a timestamp open while its series are drawn
+    fields = {field for series in series_list for field in series_fields(series)}
+    utils.cache_size = max(utils.cache_size, len(fields))
+
+    saved = []
+    for timestamp_str in timestamp_dirs:
+        frame_fields.clear()
+        for series in series_list:
+            if len(series_list) == 1:
+                saved.append(render_frame(series, timestamp_str, data_dir, plot_dir))
+                continue
+            # One broken series should not stop the rest of a batch
+            try:
+                saved.append(render_frame(series, timestamp_str, data_dir, plot_dir))
+            except Exception as e:
+                print(f"❌ {' '.join(map(str, series))} at {timestamp_str}: {e}")
+    frame_fields.clear()
+    for template in templates.values():
+        template.close()
+    templates.clear()
+    utils.clear_cache()
+    return saved
+
+def main(series_list, workers=1, data_dir=base_dir, plot_dir=plot_dir):
+    timestamp_dirs = sorted(os.listdir(data_dir))
+    if not timestamp_dirs:
+        raise FileNotFoundError(f"No timestamp directories found in {data_dir}")
+
+    if workers <= 1:
+        saved = render_frames(series_list, timestamp_dirs, data_dir, plot_dir)
+    else:
+        # Contiguous blocks keep output order deterministic; workers are spawned so
+        # each one opens its own files and reads only its own frames
+        blocks = [timestamp_dirs[b[0]:b[-1] + 1] for b in np.array_split(np.arange(len(timestamp_dirs)), workers) if len(b)]
+        with ProcessPoolExecutor(max_workers=len(blocks), mp_context=multiprocessing.get_context("spawn")) as pool:
+            args = [[series_list] * len(blocks), blocks, [data_dir] * len(blocks), [plot_dir] * len(blocks)]
+            saved = [path for block in pool.map(render_frames, *args) for path in block]
+    print(f"\n📊 Saved {len(saved)} frames")
+    return saved
+
+if __name__ == "__main__":
+    if "--workers" in sys.argv:
+        workers = int(sys.argv[sys.argv.index("--workers") + 1])
+    main([(main_var, main_level, contour_var, quiver)], workers)
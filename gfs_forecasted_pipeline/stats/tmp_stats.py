@@ -4,43 +4,62 @@ import xarray as xr
 import pandas as pd
 import numpy as np
 
+from gfs_forecasted_pipeline.download import convert
+
 # === Config ===
 source = "gfs_forecasted"
 base_dir = f"/ocean/projects/atm200005p/esohn1/gfsum_master/data/{source}/processed_netcdf"
 output_csv = f"/ocean/projects/atm200005p/esohn1/gfsum_master/stats/{source}/tmp_5day_summary.csv"
-os.makedirs(os.path.dirname(output_csv), exist_ok=True)
 
 levels = ["1000mb", "850mb", "700mb", "500mb", "300mb"]
 start_date = pd.to_datetime("2025-07-14")
 end_date = pd.to_datetime("2025-07-19")
 
-# Accumulate stats per level
-level_data = {lvl: [] for lvl in levels}
+def main(base_dir=base_dir, output_csv=output_csv, start_date=start_date, end_date=end_date, levels=levels, lead=None):
+    os.makedirs(os.path.dirname(output_csv), exist_ok=True)
+
+    # Directories are named as convert.py names them (_f<FFF> in a lead-time matrix);
+    # the first configured lead unless another is given
+    lead = convert.forecast_hours[0] if lead is None else lead
+
+    # Accumulate stats per level
+    level_data = {lvl: [] for lvl in levels}
 
-for date in pd.date_range(start_date, end_date, freq="6H"):
-    timestamp = date.strftime("%Y%m%d_t%Hz")
-    file_path = os.path.join(base_dir, timestamp, "TMP.nc")
-    if not os.path.exists(file_path):
-        print(f"⚠️ Missing: {file_path}")
-        continue
+    for date in pd.date_range(start_date, end_date, freq="6H"):
+        timestamp = convert.output_label(date, lead)
+        file_path = os.path.join(base_dir, timestamp, "TMP.nc")
+        if not os.path.exists(file_path):
+            print(f"⚠️ Missing: {file_path}")
+            continue
 
-    ds = xr.open_dataset(file_path)
+        with xr.open_dataset(file_path) as ds:
+            if "TMP" in ds and "pressure" in ds["TMP"].dims:
+                # Stacked layout: every level present in one read
+                present = [lvl for lvl in levels if int(lvl.replace("mb", "")) in ds["pressure"].values]
+                profile = ds["TMP"].sel(pressure=[int(lvl.replace("mb", "")) for lvl in present]).values
+                for i, level in enumerate(present):
+                    level_data[level].append(profile[:, i])
+                continue
+            for level in levels:
+                varname = f"TMP_{level}"
+                if varname in ds:
+                    level_data[level].append(ds[varname].values)
+
+    # Compute daily stats
+    records = []
     for level in levels:
-        varname = f"TMP_{level}"
-        if varname in ds:
-            level_data[level].append(ds[varname].values)
-
-# Compute daily stats
-records = []
-for level in levels:
-    arr = np.stack(level_data[level])
-    records.append({
-        "Level": level,
-        "TMP_min": float(np.nanmin(arr)),
-        "TMP_max": float(np.nanmax(arr)),
-        "TMP_mean": float(np.nanmean(arr))
-    })
-
-df = pd.DataFrame(records)
-df.to_csv(output_csv, index=False)
-print(f"✅ Saved GFS TMP summary to {output_csv}")
+        arr = np.stack(level_data[level])
+        records.append({
+            "Level": level,
+            "TMP_min": float(np.nanmin(arr)),
+            "TMP_max": float(np.nanmax(arr)),
+            "TMP_mean": float(np.nanmean(arr))
+        })
+
+    df = pd.DataFrame(records)
+    df.to_csv(output_csv, index=False)
+    print(f"✅ Saved GFS TMP summary to {output_csv}")
+    return df
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+# === batch_convert.py ===
+# Convert every cycle under the cylc share/cycle tree for every STASH code in
+# config.yaml. Finished (cycle, stash) pairs are checkpointed, so a crashed or
+# cancelled job picks up where it left off when it is resubmitted.
+import io
+import os
+import re
+import sys
+import json
+import time
+import contextlib
+from glob import glob
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import makenetcdf
+import interp_pressure
+
+stash_codes = makenetcdf.config["stash_codes"]
+batch_workers = int(makenetcdf.config.get("batch_workers", 1))
+checkpoint_path = os.path.join(makenetcdf.rosefolder, "batch_checkpoint.jsonl")
+
+def find_cycles():
+    # Cycle directories look like 2025MMDDT0000Z; makenetcdf.py takes 'MMDD'
+    pattern = re.escape(makenetcdf.cycle_year) + r"(\d{4})T0000Z"
+    names = sorted(os.listdir(makenetcdf.files_directory_UKCA))
+    return [m.group(1) for m in (re.fullmatch(pattern, name) for name in names) if m]
+
+def load_checkpoint():
+    # The last record for a pair wins, so a later failure undoes an earlier success
+    done = set()
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path) as f:
+            for line in f:
+                rec = json.loads(line)
+                if rec["status"] == "done":
+                    done.add((rec["cycle"], rec["stash"]))
+                else:
+                    done.discard((rec["cycle"], rec["stash"]))
+    return done
+
+def record(cycle, stash, status, output=None):
+    with open(checkpoint_path, "a") as f:
+        f.write(json.dumps({"cycle": cycle, "stash": stash, "status": status,
+                            "output": output, "time": time.strftime("%Y-%m-%d %H:%M:%S")}) + "\n")
+
+def find_output(cycle, stash):
+    matches = glob(os.path.join(makenetcdf.rosefolder, cycle, f"glm_*_{stash}.nc"))
+    return matches[0] if matches else None
+
+def newest_input(cycle):
+    mtimes = [os.path.getmtime(f) for files in makenetcdf.cycle_pp_files(cycle) for f in files]
+    return max(mtimes) if mtimes else None
+
+def is_current(cycle, stash, done, newest):
+    # A file left behind by a crash has no "done" record, so it is redone
+    output = find_output(cycle, stash)
+    return (cycle, stash) in done and output is not None and os.path.getmtime(output) > newest
+
+def run_task(cycle, stashes, stream):
+    """
+    One pass over a cycle's pp files for all of its pending STASH codes.
+    Output is captured and returned with the result instead of interleaving
+    on stdout.
+    """
+    log = io.StringIO()
+    t0 = time.time()
+    error = None
+    try:
+        with contextlib.redirect_stdout(log):
+            makenetcdf.main(stashes, cycle, stream=stream)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    return cycle, stashes, error, t0, time.time() - t0, log.getvalue()
+
+def run_interp(cycle):
+    log = io.StringIO()
+    error = None
+    try:
+        with contextlib.redirect_stdout(log):
+            interp_pressure.main(cycle)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    return cycle, error, log.getvalue()
+
+def main(cycles=None, stream=False):
+    """
+    Convert the given cycles ('MMDD', default: every cycle under the share
+    directory) for every STASH code in config.yaml, then interpolate each
+    cycle that converted cleanly to pressure levels. Returns the failed
+    conversions and interpolations.
+    """
+    os.makedirs(makenetcdf.rosefolder, exist_ok=True)
+    done = load_checkpoint()
+
+    tasks = []
+    n_pairs = 0
+    cycles = find_cycles() if cycles is None else list(cycles)
+    converted = []
+    for cycle in cycles:
+        newest = newest_input(cycle)
+        if newest is None:
+            print(f"⚠️ No pp files for cycle {cycle}, skipping")
+            continue
+        converted.append(cycle)
+        n_pairs += len(stash_codes)
+        pending = [stash for stash in stash_codes if not is_current(cycle, stash, done, newest)]
+        if pending:
+            tasks.append((cycle, pending))
+    n_pending = sum(len(pending) for _, pending in tasks)
+    print(f"🚀 {n_pending}/{n_pairs} (cycle, stash) pairs to convert in {len(tasks)} cycle passes "
+          f"on {batch_workers} workers")
+
+    t0 = time.time()
+    failed = []
+    interp_failed = []
+    with ProcessPoolExecutor(max_workers=batch_workers) as pool:
+        futures = [pool.submit(run_task, cycle, pending, stream) for cycle, pending in tasks]
+        for future in as_completed(futures):
+            cycle, stashes, error, started, elapsed, log = future.result()
+            missing = []
+            for stash in stashes:
+                output = find_output(cycle, stash)
+                if error is None and output is not None and os.path.getmtime(output) >= started:
+                    record(cycle, stash, "done", output)
+                else:
+                    record(cycle, stash, "failed")
+                    missing.append(stash)
+            print(f"{'❌' if missing else '✅'} {cycle} {','.join(stashes)} ({elapsed:.0f}s)")
+            if missing:
+                failed.append((cycle, missing, error, log))
+
+        # Pressure-level files are rebuilt only where older than their inputs, and
+        # only for cycles whose conversion went through
+        failed_cycles = {cycle for cycle, _, _, _ in failed}
+        if interp_pressure.pressure_levels:
+            for cycle in sorted(failed_cycles):
+                print(f"⚠️ {cycle} pressure levels skipped (conversion failed)")
+            futures = [pool.submit(run_interp, cycle) for cycle in converted if cycle not in failed_cycles]
+            for future in as_completed(futures):
+                cycle, error, log = future.result()
+                print(f"{'❌' if error else '✅'} {cycle} pressure levels")
+                if error:
+                    interp_failed.append((cycle, error, log))
+
+    print(f"\n📊 Converted {n_pending - sum(len(m) for _, m, _, _ in failed)}/{n_pending} pairs "
+          f"in {time.time() - t0:.0f}s")
+    for cycle, missing, error, log in sorted(failed):
+        print(f"\n❌ {cycle} {','.join(missing)}: {error or 'no output written'}\n{log.rstrip()}")
+    for cycle, error, log in sorted(interp_failed):
+        print(f"\n❌ {cycle} pressure levels: {error}\n{log.rstrip()}")
+    return failed, interp_failed
+
+if __name__ == "__main__":
+    # Optional cycles ('MMDD') to convert instead of every cycle, and --stream
+    args = [arg for arg in sys.argv[1:] if arg != "--stream"]
+    main(args or None, stream="--stream" in sys.argv)
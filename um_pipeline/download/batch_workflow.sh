@@ -0,0 +1,5 @@
+#!/bin/bash
+module load anaconda3
+conda activate iris-env
+cd /ocean/projects/atm200005p/esohn1/gfsum_master/um_pipeline/download
+python batch_convert.py $PYOPTS
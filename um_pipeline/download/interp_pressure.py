@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Interpolates the model-level NetCDF files of one cycle written by
+makenetcdf.py onto pressure levels (linear in log pressure), using the
+air pressure of the same cycle on the field's own levels: m01s00i407 (rho
+levels) for u and v, m01s00i408 (theta levels) otherwise. Air temperature is
+derived from theta and pressure on model levels before interpolating.
+Output files sit next to the inputs with a _plev suffix and a `pressure`
+dimension in hPa. Levels below the lowest model level are left missing.
+
+Usage: python interp_pressure.py MMDD
+"""
+
+import os
+import sys
+import time
+from glob import glob
+import numpy as np
+import xarray as xr
+import yaml
+
+with open(os.path.join(os.path.dirname(__file__), '../config.yaml')) as f:
+    config = yaml.safe_load(f)
+
+rose = config.get('rose', 'u-dq502')
+rosefolder = config.get('output_dir', '/ocean/projects/atm200005p/esohn1/gfsum_master/data/um/'+rose).rstrip('/')+'/'
+pressure_levels = config.get('pressure_levels') or []
+pressure_level_stash = config.get('pressure_level_stash') or []
+chunk_steps = int(config.get('interp_chunk_steps', 4))
+
+pressure_stash = 'm01s00i408'  # air pressure on theta levels
+rho_pressure_stash = 'm01s00i407'  # air pressure on rho levels
+rho_level_stash = {'m01s00i002', 'm01s00i003'}  # u, v
+theta_stash = 'm01s00i004'
+kappa = 0.286  # Rd/Cp
+
+
+def find_input(cycle_dir, stash):
+    matches = glob(os.path.join(cycle_dir, f'glm_*_{stash}.nc'))
+    return matches[0] if matches else None
+
+
+def plev_path(path):
+    return path[:-len('.nc')] + '_plev.nc'
+
+
+def is_current(out_path, inputs):
+    return os.path.exists(out_path) and os.path.getmtime(out_path) > max(os.path.getmtime(p) for p in inputs)
+
+
+def model_level_field(ds):
+    names = [name for name in ds.data_vars if 'model_level_number' in ds[name].dims]
+    if not names:
+        return None
+    return ds[names[0]]
+
+
+def interp_columns(values, log_p, log_targets):
+    """
+    Interpolate values (level, n) linearly in log pressure to log_targets,
+    for n columns at once. Pressure falls with model level, so the number of
+    levels at or above each target pressure is the index of the level just
+    above it. Returns (target, n), NaN where the target is outside the column.
+    """
+    nlev = log_p.shape[0]
+    out = np.full((len(log_targets), log_p.shape[1]), np.nan, dtype=np.float32)
+    cols = np.arange(log_p.shape[1])
+    for i, target in enumerate(log_targets):
+        upper = (log_p >= target).sum(axis=0)
+        ok = (upper > 0) & (upper < nlev)
+        hi = np.where(ok, upper, 1)
+        lo = hi - 1
+        p_lo, p_hi = log_p[lo, cols], log_p[hi, cols]
+        weight = (target - p_lo) / (p_hi - p_lo)
+        v_lo, v_hi = values[lo, cols], values[hi, cols]
+        out[i] = np.where(ok, v_lo + weight * (v_hi - v_lo), np.nan)
+    return out
+
+
+def interpolate_to_pressure(field, pres, out_path, name, derive=None):
+    """
+    Interpolate field (time, model_level_number, latitude, longitude) to
+    pressure_levels and write out_path. pres is aligned to field first: times
+    and levels are intersected and, for fields on a staggered grid (u, v),
+    pressure is taken from the nearest grid point. derive(values, pressure)
+    turns the model-level values into the field to interpolate. The work is
+    done chunk_steps time steps at a time over all columns in the domain.
+    """
+    field, pres = xr.align(field, pres, join='inner', exclude=['latitude', 'longitude'])
+    if not (np.array_equal(field.latitude, pres.latitude) and np.array_equal(field.longitude, pres.longitude)):
+        pres = pres.sel(latitude=field.latitude, longitude=field.longitude, method='nearest')
+        pres = pres.assign_coords(latitude=field.latitude, longitude=field.longitude)
+    field = field.transpose('time', 'model_level_number', 'latitude', 'longitude')
+    pres = pres.transpose('time', 'model_level_number', 'latitude', 'longitude')
+
+    ntime, nlev, nlat, nlon = field.shape
+    log_targets = np.log(np.array(pressure_levels, dtype=np.float64) * 100.0)
+    result = np.empty((ntime, len(pressure_levels), nlat, nlon), dtype=np.float32)
+    for t0 in range(0, ntime, chunk_steps):
+        t1 = min(t0 + chunk_steps, ntime)
+        p = pres[t0:t1].values.astype(np.float64)
+        values = field[t0:t1].values.astype(np.float64)
+        if derive is not None:
+            values = derive(values, p)
+        # (level, time*lat*lon) columns
+        p = np.moveaxis(p, 1, 0).reshape(nlev, -1)
+        values = np.moveaxis(values, 1, 0).reshape(nlev, -1)
+        columns = interp_columns(values, np.log(p), log_targets)
+        result[t0:t1] = np.moveaxis(columns.reshape(len(pressure_levels), t1 - t0, nlat, nlon), 0, 1)
+
+    out = xr.DataArray(
+        result, name=name,
+        dims=('time', 'pressure', 'latitude', 'longitude'),
+        coords={'time': field.time, 'pressure': ('pressure', np.array(pressure_levels),
+                                                 {'units': 'hPa', 'long_name': 'pressure', 'positive': 'down'}),
+                'latitude': field.latitude, 'longitude': field.longitude},
+        attrs=dict(field.attrs),
+    )
+    if derive is not None:
+        out.attrs.pop('STASH', None)
+        out.attrs['standard_name'] = name
+    ds = out.to_dataset()
+    ds[name].encoding['_FillValue'] = np.float32(np.nan)
+    tmp_path = out_path + '.part'
+    ds.to_netcdf(tmp_path, unlimited_dims=['time'])
+    os.replace(tmp_path, out_path)
+    print(f"✅ Wrote {out_path}")
+
+
+def main(cycle):
+    t0 = time.time()
+    cycle_dir = rosefolder + cycle + '/'
+    pres_paths = {stash: find_input(cycle_dir, stash) for stash in (pressure_stash, rho_pressure_stash)}
+
+    jobs = []
+    for stash in pressure_level_stash:
+        path = find_input(cycle_dir, stash)
+        if path is None:
+            print(f"⚠️ No {stash} output for cycle {cycle}, skipping")
+            continue
+        pres_stash = rho_pressure_stash if stash in rho_level_stash else pressure_stash
+        jobs.append((path, plev_path(path), pres_stash, None, None))
+    theta_path = find_input(cycle_dir, theta_stash)
+    if theta_path is not None:
+        jobs.append((theta_path, os.path.join(cycle_dir, 'glm_air_temperature_plev.nc'), pressure_stash,
+                     'air_temperature', lambda theta, p: theta * (p / 100000.0) ** kappa))
+
+    for path, out_path, pres_stash, name, derive in jobs:
+        pres_path = pres_paths[pres_stash]
+        if pres_path is None:
+            print(f"❌ No air pressure ({pres_stash}) output for cycle {cycle}, skipping {path}")
+            continue
+        if is_current(out_path, [path, pres_path]):
+            print(f"⏭️ Up to date: {out_path}")
+            continue
+        with xr.open_dataset(path, decode_timedelta=True) as ds, \
+                xr.open_dataset(pres_path, decode_timedelta=True) as pres_ds:
+            field = model_level_field(ds)
+            pres = model_level_field(pres_ds)
+            if field is None or pres is None:
+                print(f"⚠️ {path if field is None else pres_path} has no model levels, skipping")
+                continue
+            interpolate_to_pressure(field, pres, out_path, name or field.name, derive)
+    print(f"⏱️ Pressure-level interpolation for {cycle} took {time.time() - t0:.0f}s")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1])
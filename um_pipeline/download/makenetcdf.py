@@ -1,7 +1,9 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 """
-Concatenates cubes from UM output pp files into netcdf files. Not parallelised, slow and memory-intensive
+Concatenates cubes from UM output pp files into netcdf files. Not parallelised.
+With --stream, each pp file step is appended to the output as soon as it is read,
+so memory stays flat however many pp files a cycle has.
 Base code developed by Hamish Gordon,Jesus Vergara Temprado and Kirsty Pringle
 Additions to customize script for HALOsouth developed by Eric Giuffrida
 h.gordon@leeds.ac.uk
@@ -18,21 +20,64 @@ Carnegie Mellon Universtiy 2025
 """
 
 import sys
+import json
+import shutil
+import struct
+import tempfile
 import numpy as np
-import time
+import resource
 import iris
+import iris.util
+import iris.exceptions
+import cf_units
+import netCDF4
 from glob import glob
 import datetime
 from scipy.io import netcdf
 import os
+import yaml
 import pandas as pd
 
+with open(os.path.join(os.path.dirname(__file__), '../config.yaml')) as f:
+    config = yaml.safe_load(f)
+
+extent = config.get('extent')
+if extent:
+    lonwest, loneast, latbottom, lattop = extent
+#Boxes inside the pp longitudes (0-360) are cut at load; boxes across the 0/360
+#seam (or given in -180..180) need intersection's roll after loading
+lon_at_load = bool(extent) and 0 <= lonwest < loneast <= 360
+model_levels = config.get('model_levels') or []
+#Fields interpolated to pressure levels need every model level too
+full_column_stash = set(config.get('full_column_stash') or []) | set(config.get('pressure_level_stash') or [])
+use_pp_index = bool(config.get('pp_index', False))
+
+rose = config.get('rose', 'u-dq502')
+cycle_year = str(config.get('cycle_year', '2025'))
+files_directory_UKCA = config.get('cylc_share_dir', '/jet/home/earhg/cylc-run/'+rose+'/share/cycle').rstrip('/')+'/'
+rosefolder = config.get('output_dir', '/ocean/projects/atm200005p/esohn1/gfsum_master/data/um/'+rose).rstrip('/')+'/'
+filechunks = ['pa','pb','pc','pd','pe']
+
+
+def cycle_pp_files(cycle):
+    #pp files of one cycle ('MMDD'), one sorted list per output stream
+    files_directory=files_directory_UKCA+cycle_year+cycle+'T0000Z/glm/um/'
+    return [sorted(glob(files_directory+'*gl*'+chunk+'*')) for chunk in filechunks]
+
 def lat_range(cell):
-   return (latbottom < cell < lattop)
+   return (latbottom <= cell <= lattop)
 
 
-def height_level_range(cell):
-    return cell in [0,2,5,6,9,11,13,15,16,17,18,20,24,26,29,33,35,37,41,46]
+def lon_range(cell):
+   return (lonwest <= cell <= loneast)
+
+
+def region_constraint():
+    #Latitude, and longitude when the box does not cross 0/360, cut at load time
+    constr = iris.Constraint(latitude=lat_range)
+    if lon_at_load:
+        constr = constr & iris.Constraint(longitude=lon_range)
+    return constr
 
 
 def make_directories(newdir):
@@ -46,56 +91,290 @@ def make_directories(newdir):
 
 
 
-def save_small_nc_files(bigarray, ncfolder, stashcode, timepointslist):
-    print('Begin Saving')
-    print('Save Location: {}'.format(ncfolder))
-    i=0
-    for j in range(0,len(bigarray)):
-        for cube in bigarray[j]:
-            #print cube
-            saving_name = ncfolder+'glm_'+stashcode+'_'+str(timepointslist[i])+'.nc'
-            print ('saving',saving_name)
-            iris.save(cube, saving_name, netcdf_format="NETCDF4")
-            i=i+1
-    return('Saving Complete')
-
-
-def concatenate_nc_files(smallncfolder, bigncfolder, stashcode):
-    print('Begin Concatenation')
+def save_merged_nc(cubelist, bigncfolder, stashcode):
+    """
+    Merge one cube name's time slices in memory and write the output NetCDF
+    once. The slices still hold lazy pp data, so iris streams it from the pp
+    files while saving instead of round-tripping through one small NetCDF per
+    timestep. merge_cube raises if the slices do not merge into one cube, so
+    a metadata mismatch cannot silently drop time steps.
+    """
+    print('Begin Merge')
     print('Save Location: {}'.format(bigncfolder))
-    cubes = iris.load(smallncfolder+'*'+stashcode+'*.nc')
-
-    print(cubes)
-    cube = cubes[0]
-    print(cube)
+    cube = cubelist.merge_cube()
+    if not cube.coord_dims('time'):
+        cube = iris.util.new_axis(cube, 'time')
     time_array = cube.coord('time').points
-    print('Concatenated {} files'.format(len(time_array)))
+    print('Merged {} time steps'.format(len(time_array)))
     saving_name = bigncfolder+'glm_'+cube.name()+'_'+stashcode+'.nc'
-    iris.save(cube,saving_name, netcdf_format="NETCDF4")
+    iris.save(cube, saving_name, netcdf_format="NETCDF4", unlimited_dimensions=['time'])
     print('File {} Saved'.format(saving_name))
     print('\n')
 
 
-def delete_smallnc(smallncfolder, stashcode):
-    stashfiles = sorted(glob(smallncfolder+'*'+stashcode+'*'))
-    for stashfile in stashfiles:
-        os.remove(stashfile)
-    print('Deleted {} small nc files for stash {}'.format(len(stashfiles), stashcode))
-
+#Bump when the index record layout changes so older indexes are rebuilt
+PP_INDEX_VERSION = 2
+LAND_MASK_STASH = 'm01s00i030'
+
+
+def build_pp_index(pp_file):
+    """
+    Scan the pp file's Fortran records directly (a 256-byte header record then
+    a data record per field, each framed by big-endian 4-byte lengths) without
+    decoding any data. Returns [stash, validity time, lbvc, lblev, lbpack,
+    start, length] per field in file order, where start/length are the byte
+    range of the field's header and data records. Anything other than 32-bit
+    record framing (64-bit or truncated files) raises ValueError.
+    """
+    records = []
+    with open(pp_file, 'rb') as f:
+        while True:
+            start = f.tell()
+            head = f.read(4)
+            if len(head) < 4:
+                break
+            header = f.read(256)
+            trailer = f.read(4)
+            if struct.unpack('>i', head)[0] != 256 or len(header) < 256 or trailer != head:
+                raise ValueError('{}: unexpected pp header record at byte {}'.format(pp_file, start))
+            ints = np.frombuffer(header[:180], dtype='>i4')
+            head = f.read(4)
+            if len(head) < 4:
+                raise ValueError('{}: missing pp data record at byte {}'.format(pp_file, f.tell()))
+            data_length = struct.unpack('>i', head)[0]
+            f.seek(data_length, 1)
+            if data_length < 0 or f.read(4) != head:
+                raise ValueError('{}: unexpected pp data record at byte {}'.format(pp_file, start + 264))
+            stash = 'm{:02d}s{:02d}i{:03d}'.format(ints[44], ints[41] // 1000, ints[41] % 1000)
+            t1 = '{:04d}-{:02d}-{:02d} {:02d}:{:02d}'.format(*ints[:5])
+            records.append([stash, t1, int(ints[25]), int(ints[32]), int(ints[20]), start, f.tell() - start])
+    return records
+
+
+def update_pp_index(pp_files, index_path):
+    """
+    Load the cycle's pp header index from index_path, (re)building entries
+    for pp files that are new or have changed size/mtime, and save it back.
+    Files the scan cannot read get fields None and are loaded whole instead.
+    """
+    index = {}
+    if os.path.exists(index_path):
+        with open(index_path) as f:
+            index = json.load(f)
+    changed = 0
+    for pp_file in (pp_file for files in pp_files for pp_file in files):
+        st = os.stat(pp_file)
+        entry = index.get(pp_file)
+        if (entry and entry.get('version') == PP_INDEX_VERSION
+                and entry['size'] == st.st_size and entry['mtime'] == st.st_mtime):
+            continue
+        print ('indexing ' + str(pp_file))
+        try:
+            fields = build_pp_index(pp_file)
+        except ValueError as e:
+            print('⚠️ Not indexing {} ({}), it will be loaded whole'.format(pp_file, e))
+            fields = None
+        index[pp_file] = {'version': PP_INDEX_VERSION, 'size': st.st_size, 'mtime': st.st_mtime,
+                          'fields': fields}
+        changed += 1
+    if changed:
+        with open(index_path + '.tmp', 'w') as f:
+            json.dump(index, f)
+        os.replace(index_path + '.tmp', index_path)
+    print('pp index: {} files, {} (re)indexed'.format(len(index), changed))
+    return index
+
+
+def wanted_field(stash, lbvc, lblev, stashcodes):
+    #lbvc 65 marks hybrid height model levels; single-level fields are always kept
+    if stash not in stashcodes:
+        return False
+    if model_levels and lbvc == 65 and stash not in full_column_stash:
+        return lblev in model_levels
+    return True
+
+
+def load_indexed(pp_file, stashcodes, index, constraints, extract_dir):
+    """
+    Load only the indexed fields that are wanted: files without any wanted
+    STASH are skipped outright, otherwise the wanted records (plus the land
+    mask that land-packed fields need) are copied by byte range into a small
+    pp file in extract_dir and iris loads that, so it never reads or decodes
+    the rest of the file. The extract must outlive the lazy cubes.
+    """
+    records = index[pp_file]['fields']
+    wanted = [(start, length, lbpack) for stash, t1, lbvc, lblev, lbpack, start, length in records
+              if wanted_field(stash, lbvc, lblev, stashcodes)]
+    if not wanted:
+        print ('skipping ' + str(pp_file) + ' (no wanted fields)')
+        return iris.cube.CubeList()
+    print ('loading {} fields from {}'.format(len(wanted), pp_file))
+    ranges = [(start, length) for start, length, lbpack in wanted]
+    if any((lbpack // 100) % 10 == 2 for start, length, lbpack in wanted):
+        ranges = [(start, length) for stash, t1, lbvc, lblev, lbpack, start, length in records
+                  if stash == LAND_MASK_STASH] + ranges
+    extract = os.path.join(extract_dir, os.path.basename(pp_file) + '.pp')
+    with open(pp_file, 'rb') as src, open(extract, 'wb') as dst:
+        for start, length in ranges:
+            src.seek(start)
+            dst.write(src.read(length))
+    return iris.load(extract, constraints)
+
+
+def write_time_steps(cubelist, bigncfolder, stashcode, first):
+    """
+    Stream mode: merge one cube name's time slices read from one pp file step
+    and write them out right away. The first step creates the NetCDF with iris
+    (time unlimited); later steps are appended along time with netCDF4,
+    realising one time step at a time. As in save_merged_nc, slices that do
+    not merge into one cube raise instead of being dropped.
+    """
+    cube = cubelist.merge_cube()
+    if not cube.coord_dims('time'):
+        cube = iris.util.new_axis(cube, 'time')
+    saving_name = bigncfolder+'glm_'+cube.name()+'_'+stashcode+'.nc'
+    if first:
+        iris.save(cube, saving_name, netcdf_format="NETCDF4", unlimited_dimensions=['time'])
+        print('File {} Started'.format(saving_name))
+        return saving_name
+
+    with netCDF4.Dataset(saving_name, 'a') as nc:
+        n = nc.dimensions['time'].size
+        k = cube.coord('time').shape[0]
+        for name, ncvar in nc.variables.items():
+            if not ncvar.dimensions or ncvar.dimensions[0] != 'time':
+                continue
+            if getattr(ncvar, 'um_stash_source', None) == stashcode:
+                for i, sub_cube in enumerate(cube.slices_over('time')):
+                    ncvar[n+i] = sub_cube.data
+                continue
+            #Time-dependent coordinates (time, forecast_period, ...) and their bounds
+            coord_name = name[:-len('_bnds')] if name.endswith('_bnds') else name
+            coords = [c for c in cube.coords() if coord_name in (c.var_name, c.name())]
+            if not coords:
+                continue
+            values = coords[0].bounds if name.endswith('_bnds') else coords[0].points
+            if values is None:
+                continue
+            if hasattr(ncvar, 'units'):
+                file_units = cf_units.Unit(ncvar.units, calendar=getattr(ncvar, 'calendar', None))
+                values = coords[0].units.convert(values, file_units)
+            ncvar[n:n+k] = values
+    print('Appended {} time steps to {}'.format(k, saving_name))
+    return saving_name
+
+
+def report_peak_memory():
+    #ru_maxrss is in kilobytes on Linux
+    peak_gb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024**2
+    print('📈 Peak memory: {:.2f} GB (size SLURM --mem above this)'.format(peak_gb))
+
+
+def clean_cube(cube, tacc3hr=0):
+    #Remove unwanted dimensions
+    cube.remove_coord('forecast_reference_time')
+    altitude_factories = [f for f in cube.aux_factories if f.standard_name == 'altitude']
+    for f in altitude_factories:
+        cube.remove_aux_factory(f)
+    try:
+        cube.remove_coord('surface_altitude')
+    except Exception:
+        pass
+    try:
+        cube.remove_coord('altitude')
+    except Exception:
+        pass
+    if 'ukmo__process_flags' in cube.attributes:
+        del cube.attributes['ukmo__process_flags']
+    if tacc3hr==1:
+        cube.coord('time').bounds = None
+        iris.util.promote_aux_coord_to_dim_coord(cube,'time')
+
+    #Boxes across 0/360 are cut here (the rest of the region, and the model
+    #levels, are applied at load time); intersection wraps and keeps the data lazy
+    if extent and not lon_at_load:
+        cube = cube.intersection(longitude=(lonwest, loneast))
+    return cube
+
+
+def make_level_callback(stashcodes):
+    #iris.load callback dropping unwanted model levels field by field, so
+    #single-level fields (no model_level_number) load as before
+    def level_callback(cube, field, filename):
+        if not wanted_field(str(field.stash), int(field.lbvc), int(field.lblev), stashcodes):
+            raise iris.exceptions.IgnoreCubeException()
+    return level_callback
+
+
+def drop_overlap(cube, timepoints):
+    """
+    Keep the time steps of cube that are not already in timepoints (and the
+    first of any repeated within cube), extracted with one index along the
+    time dimension. Any overlap length works. A single kept step is indexed
+    with a scalar so time becomes a scalar coord like every other slice.
+    Returns None when every step is a duplicate.
+    """
+    points = cube.coord('time').points
+    keep = np.zeros(len(points), dtype=bool)
+    keep[np.unique(points, return_index=True)[1]] = True
+    keep &= ~np.isin(points, timepoints)
+    if keep.all():
+        return cube
+    print ('removing', points[~keep])
+    if not keep.any():
+        return None
+    kept = np.flatnonzero(keep)
+    index = [slice(None)] * cube.ndim
+    index[cube.coord_dims('time')[0]] = kept[0] if len(kept) == 1 else kept
+    return cube[tuple(index)]
+
+
+def add_cube(series, cube):
+    """
+    Append cube's time slices to the matching entry of series, a list of
+    [name, CubeList, timepoints] entries (one per cube name) for a single
+    STASH code. Cubes from later files first have their overlapping times
+    removed. Every slice is appended with a scalar time coord, including
+    a cube that has a length-1 time dimension, so the slices merge back into
+    one cube. Only metadata is touched, so the pp data stays lazy.
+    """
+    for entry in series:
+        if cube.name() == entry[0]:
+            cube = drop_overlap(cube, entry[2])
+            if cube is None:
+                return
+            cube = clean_cube(cube)
+            break
+    else:
+        entry = [cube.name(), iris.cube.CubeList(), np.array([])]
+        series.append(entry)
+        cube = clean_cube(cube)
 
-def main(stashcode, cycle):
-    latconstr = iris.Constraint(latitude=lat_range)
-    #model_lev_constr = iris.Constraint(model_level_number=height_level_range)
+    if cube.coord_dims('time'):
+        for sub_cube in cube.slices_over('time'):
+            entry[1].append(sub_cube)
+    else:
+        entry[1].append(cube)
+    entry[2] = np.append(entry[2], cube.coord('time').points)
+
+
+def main(stashcodes, cycle, stream=False):
+    """
+    Convert one cycle's pp output for one or more STASH codes. Every pp file
+    is read once with a constraint per STASH code and each cube is routed
+    to its own STASH's output, so extracting N fields costs one pass
+    over the pp files instead of N. With stream=True, each file step is
+    written out before the next is read, and only the time points are
+    kept for overlap removal.
+    """
+    if isinstance(stashcodes, str):
+        stashcodes = [stashcodes]
 
-    rose = 'u-dq502'
-    files_directory_UKCA = '/jet/home/earhg/cylc-run/'+rose+'/share/cycle/'
     iday=cycle   #current cycle as MM-DD
     print (iday)
-    print (stashcode)
-    filechunks = ['pa','pb','pc','pd','pe']
+    print (stashcodes)
 
-    files_directory=files_directory_UKCA+'2025'+iday+'T0000Z/glm/um/' 
-    pp_files1=[sorted(glob(files_directory+'*gl*'+chunk+'*')) for chunk in filechunks]
+    pp_files1=cycle_pp_files(iday)
     if iday == '0601': 
         pp_files = pp_files1 #for no overlap
     else:
@@ -103,183 +382,63 @@ def main(stashcode, cycle):
     #pp_files = [pp_files1[0][8:], pp_files1[1][8:], pp_files1[2][8:]] #for 24 hour overlap
     #pp_files = [pp_files1[0][16:], pp_files1[1][16:], pp_files1[2][16:]] #for 48 hour overlap
     
-    rosefolder = '/ocean/projects/atm200005p/esohn1/gfsum_master/data/um/'+rose+'/'
-    smallncfolder = rosefolder+'temp_folder/'
     bigncfolder = rosefolder+cycle+'/'
-    
-    stashconstr = iris.AttributeConstraint(STASH=stashcode)
-    cubes=iris.load((pp_files[0])[0],stashconstr)
-    print ('loading cubes '+str(pp_files[0][0]))
-    if len(pp_files) > 1:
-        for filelist in pp_files[1:]:
-            print ('loading cubes '+str(filelist[0]))
-            cubel = iris.load(filelist[0],stashconstr)
-            for cube1 in cubel:
-                cubes.append(cube1)
-    coord_names = [coord.name() for coord in cubes[0].coords()]
-    
-    print (cubes)
-    print(coord_names)
-    print(cubes[0].coord('time').points)
-    tacc3hr = 0
 
-    bigarray=[]
-    timepointslist=[]
+    stashconstrs = [iris.AttributeConstraint(STASH=stashcode) for stashcode in stashcodes]
+    if extent:
+        regionconstr = region_constraint()
+        stashconstrs = [stashconstr & regionconstr for stashconstr in stashconstrs]
+    level_callback = make_level_callback(stashcodes)
+    series = {stashcode: [] for stashcode in stashcodes}
+    started = set()
+    make_directories(rosefolder)
+    make_directories(bigncfolder)
+    index = update_pp_index(pp_files, bigncfolder+'pp_index.json') if use_pp_index else None
+    extract_dir = tempfile.mkdtemp(dir=bigncfolder, prefix='pp_extract_') if use_pp_index else None
     print('Begin Cube Data Processing')
 
-    for cube in cubes:
-        cl = iris.cube.CubeList()
-    
-        #Remove unwanted dimensions
-        cube.remove_coord('forecast_reference_time')
-        altitude_factories = [f for f in cube.aux_factories if f.standard_name == 'altitude']
-        for f in altitude_factories:
-            cube.remove_aux_factory(f)        
-        try:
-            cube.remove_coord('surface_altitude')
-        except Exception:
-            pass
-        try:
-            cube.remove_coord('altitude')
-        except Exception:
-            pass
-        if 'ukmo__process_flags' in cube.attributes:
-            del cube.attributes['ukmo__process_flags']      
-        if tacc3hr==1:
-            print (cube.coord('time').points)
-            print (cube.coord('time').bounds)
-            cube.coord('time').bounds = None
-            iris.util.promote_aux_coord_to_dim_coord(cube,'time')
-        
-        #Select (lat,lon) region of interest (not needed for HALO simulations)
-        #cubelat = cube.intersection(longitude=(-60,45.5))
-        #cube = cubelat.extract(latconstr)
-
-        #Select desired model levels if stash has altitude coordinate
-        #try:
-        #    cube = cube.extract(model_lev_constr) 
-        #except Exception:
-        #    pass
-        
-        #Add cube and their indv times to a list
-        timepointslist.append(cube.coord('time').points)
-        time = cube.coord('time')
-        dates = time.units.num2date(time.points)
-        if len(dates) > 1:
-            for sub_cube in cube.slices_over('time'):
-                print(sub_cube)
-                cl.append(sub_cube)
-        else:
-            cl.append(cube)
-        bigarray.append(cl)
-    
-    print(bigarray)
-    print(timepointslist)
-    
-    if any(len(files) > 1 for files in pp_files):
-        n_steps = max(len(files) for files in pp_files)
-
-        for fileindex in range(1, n_steps):
-            morecubes = []
-
-            for chunk_files in pp_files:
-                if fileindex < len(chunk_files):
-                    step_file = chunk_files[fileindex]
-                    print ('loading cubes ' + str(step_file))
-                    chunk_cubes = iris.load(step_file, stashconstr)
-                    morecubes.extend(chunk_cubes)
-            i = 0  # Reset cube index for bigarray
-    
-            for cube in morecubes:
-                print (cube.coord('time').points)
-                #print cube
-                #print cube.ndim
-                for j in timepointslist[i]:
-                    it=0
-                    for k in cube.coord('time').points:
-                        if k ==j:
-                            print ('removing',j)
-                            if it==0:
-                                cube = cube[1:,...]
-                            elif it==1 and len(cube.coord('time').points)==2:
-                                cube = cube[0:1,...]
-                            else:
-                                raise ValueError('Overlapping fudged removal failure')
-                            print (cube)
-                        it=it+1
-
-                #Remove unwanted dimensions
-                cube.remove_coord('forecast_reference_time')
-                altitude_factories = [f for f in cube.aux_factories if f.standard_name == 'altitude']
-                for f in altitude_factories:
-                    cube.remove_aux_factory(f)
-                try:
-                    cube.remove_coord('surface_altitude')
-                except Exception:
-                    pass
-                try:
-                    cube.remove_coord('altitude')
-                except Exception:
-                    pass
-                if 'ukmo__process_flags' in cube.attributes:
-                    del cube.attributes['ukmo__process_flags']
-                if tacc3hr==1:
-                    cube.coord('time').bounds=None
-                    iris.util.promote_aux_coord_to_dim_coord(cube,'time')
-                #cubelat = cube.intersection(longitude=(-60,45.5))
-                #cube =cubelat.extract(latconstr)
-                
-                #Select desired model levels if stash has altitude coordinate
-                #try:
-                #    cube = cube.extract(model_lev_constr)
-                #except Exception:
-                #    pass
-
-                #Add cube and their indv times to the list
-                if cube.name() ==(bigarray[i])[0].name() and cube.attributes['STASH']==(bigarray[i])[0].attributes['STASH']:
-                    if len(cube.coord('time').points) >1:
-                        for sub_cube in cube.slices_over('time'):
-                            bigarray[i].append(sub_cube)
-                    else:
-                        bigarray[i].append(cube)
+    #Walk the streams file by file so each time step follows the previous one
+    n_steps = max(len(files) for files in pp_files)
+    for fileindex in range(n_steps):
+        for chunk_files in pp_files:
+            if fileindex < len(chunk_files):
+                if index is not None and index[chunk_files[fileindex]]['fields'] is not None:
+                    cubes = load_indexed(chunk_files[fileindex], stashcodes, index, stashconstrs, extract_dir)
                 else:
-                    for cubelist in bigarray:
-                        if cube.name() ==cubelist[0].name() and cube.attributes['STASH']==cubelist[0].attributes['STASH']:
-                            if len(cube.coord('time').points) >1:
-                                for sub_cube in cube.slices_over('time'):
-                                    bigarray[i].append(sub_cube)
-                            else:
-                                cubelist.append(cube)
-                            break
-                for j in cube.coord('time').points:
-                    array=timepointslist[i]
-                    print(j)
-                    timepointslist[i] = np.append(array,j)
-                i=i+1
-            print (timepointslist)
-            fileindex=fileindex+1
-    
-    #print(bigarray)
-    #print(timepointslist)
-    #print(np.shape(bigarray))
-    #print(np.shape(timepointslist))
-    #print(bigarray[0][-1])
-
-    make_directories(rosefolder)
-    make_directories(smallncfolder)
-    make_directories(bigncfolder)
-    save_small_nc_files(bigarray, smallncfolder, stashcode, timepointslist[0])
-    concatenate_nc_files(smallncfolder, bigncfolder, stashcode)
-    delete_smallnc(smallncfolder, stashcode)
+                    print ('loading cubes ' + str(chunk_files[fileindex]))
+                    cubes = iris.load(chunk_files[fileindex], stashconstrs, callback=level_callback)
+                for cube in cubes:
+                    add_cube(series[str(cube.attributes['STASH'])], cube)
+
+        if stream:
+            #Write this step's slices (one output per cube name) and let them go
+            for stashcode in stashcodes:
+                for entry in series[stashcode]:
+                    if entry[1]:
+                        key = (stashcode, entry[0])
+                        write_time_steps(entry[1], bigncfolder, stashcode, key not in started)
+                        started.add(key)
+                    entry[1] = iris.cube.CubeList()
+
+    for stashcode in stashcodes:
+        if not series[stashcode]:
+            print('❌ No fields found for stash {}'.format(stashcode))
+            continue
+        if not stream:
+            #One output per cube name under this STASH
+            for entry in series[stashcode]:
+                save_merged_nc(entry[1], bigncfolder, stashcode)
+    if extract_dir:
+        shutil.rmtree(extract_dir, ignore_errors=True)
+    report_peak_memory()
     return()
 
 
-stash = str(sys.argv[1])
-cycle = str(sys.argv[2])
-main(stash, cycle)
-sys.exit()
-
-
-
-
-
+if __name__ == "__main__":
+    #One STASH code or a comma-separated list, e.g. m01s00i004,m01s00i010, then the cycle
+    #and optionally --stream
+    args = [arg for arg in sys.argv[1:] if arg != '--stream']
+    stash = str(args[0]).split(',')
+    cycle = str(args[1])
+    main(stash, cycle, stream='--stream' in sys.argv)
+    sys.exit()
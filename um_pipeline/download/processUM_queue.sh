@@ -1,7 +1,20 @@
 #Define Cycle to process,format must be 'MMDD' (as a string in quotes)
 export PYCYCLE='0716'
 
+#Or convert every cycle for every stash_codes entry in ../config.yaml in one job;
+#finished (cycle, stash) pairs are checkpointed, so resubmitting continues where it stopped
+#sbatch -p RM-shared -n 20 -t 480 --mail-type=ALL --export=ALL,PYOPTS /ocean/projects/atm200005p/esohn1/gfsum_master/um_pipeline/download/batch_workflow.sh
+
+#Pressure-level files for one cycle once its fields are converted (batch_convert.py does this itself)
+#python /ocean/projects/atm200005p/esohn1/gfsum_master/um_pipeline/download/interp_pressure.py $PYCYCLE
+
+#Optional: append each pp file step to the output as it is read (flat memory, see the peak memory report)
+#export PYOPTS="--stream"
+
 #Define all variables to process
+#Several variables can share one pass over the pp files (comma-separated, no spaces)
+#export PYARG="m01s00i004,m01s00i010,m01s00i408" #Theta, q, air pressure
+#sbatch -p RM-shared -n 20 -t 120 --mail-type=ALL --export=ALL,PYARG,PYCYCLE /ocean/projects/atm200005p/esohn1/gfsum_master/um_pipeline/download/python_workflow.sh
 #export PYARG="m01s00i002" #u winds
 #sbatch -p RM-shared -n 20 -t 120 --mail-type=ALL --export=ALL,PYARG,PYCYCLE /ocean/projects/atm200005p/esohn1/gfsum_master/um_pipeline/download/python_workflow.sh
 #export PYARG="m01s00i003" #v winds
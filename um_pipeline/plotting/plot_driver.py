@@ -1,10 +1,15 @@
 import os
+import sys
 import numpy as np
 import xarray as xr
-import matplotlib.pyplot as plt
+import matplotlib
+matplotlib.use("Agg")
 import pandas as pd
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from um_pipeline.plotting import utils
 from um_pipeline.plotting.utils import (
-    setup_map, format_title, plot_quivers, load_main_variable, level_map, get_lon_lat
+    MapTemplate, format_title, plot_quivers, load_main_variable, level_map, get_lon_lat
 )
 from um_pipeline.plotting.color_config import COLOR_CONFIG, CONTOUR_CONFIG
 
@@ -15,65 +20,82 @@ contour_var = os.getenv("CONTOUR_VAR", None)
 if contour_var in ["None", ""]:
     contour_var = None
 quiver = os.getenv("QUIVER", "False") == "True"
-
-# === LOAD MAIN AND CONTOUR DATA ===
-ds = load_main_variable(main_var, main_level)
-ds_contour = load_main_variable(contour_var, main_level) if contour_var else None
-
-# === COLOR CONFIG ===
-config = COLOR_CONFIG[main_var]
-cmap = config["cmap"]
-bounds = config["bounds"]
-label = config["label"]
-
-# === OUTPUT DIRECTORY ===
-out_dir = f"/ocean/projects/atm200005p/esohn1/gfsum_master/plots/um/{main_var}/{main_level}"
-if contour_var:
-    out_dir = out_dir.replace(main_var, f"{main_var}_{contour_var}")
-os.makedirs(out_dir, exist_ok=True)
-
-# === LOOP THROUGH TIME STEPS ===
-for i, timestamp in enumerate(ds.time.values):
-    hour = pd.to_datetime(str(timestamp)).hour
-    if hour % 6 != 0:
-        continue
-
-    print(f"🔄 Plotting {main_var} at {main_level} — time step {i+1}")
-
-    var_name = list(ds.data_vars)[0]
-    data = ds[var_name].sel(time=timestamp)
-
-    # Select level if required
-    if main_level not in ["surface", "column"]:
-        if "model_level_number" in data.dims:
-            data = data.sel(model_level_number=level_map[main_level])
-        elif "pressure" in data.dims:
-            data = data.sel(pressure=int(main_level.replace("mb", "")))
-        else:
-            raise ValueError(f"Unexpected vertical coordinate in data: {data.dims}")
-    data = data.squeeze()
-
-    # === PLOT BASE VARIABLE ===
-    fig, ax, proj = setup_map()
+# Reuse one figure for the whole series; REUSE_MAP=False builds a new map every frame
+reuse_map = os.getenv("REUSE_MAP", "True") == "True"
+# Frames rendered in parallel (overridden by --workers N)
+workers = int(os.getenv("PLOT_WORKERS", "1"))
+base_dir = utils.base_dir
+plot_dir = "/ocean/projects/atm200005p/esohn1/gfsum_master/plots/um"
+
+# Map templates of this process, one per series, built by its first frame
+templates = {}
+# Fields of the time step being drawn, shared by every series that uses them
+frame_fields = {}
+
+def parse_series(text):
+    """
+    "RH 700mb HGT True" -> ("RH", "700mb", "HGT", True), the
+    MAIN_VAR MAIN_LEVEL CONTOUR_VAR QUIVER format of run_plot_driver_array.slurm.
+    """
+    var, level, contour, use_quiver = text.split()
+    return var, level, None if contour in ["None", ""] else contour, use_quiver == "True"
+
+def series_fields(series):
+    var, level, contour, use_quiver = series
+    fields = [(var, level)]
+    if contour:
+        fields.append((contour, level))
+    if use_quiver:
+        fields += [("UGRD", level), ("VGRD", level)]
+    return fields
+
+def out_dir_for(series, plot_dir=plot_dir):
+    main_var, main_level, contour_var, _ = series
+    return os.path.join(plot_dir, f"{main_var}_{contour_var}" if contour_var else main_var, main_level)
+
+def frame_times(series, data_dir=base_dir):
+    # Plotted every 6 hours
+    ds = load_main_variable(series[0], series[1], data_dir)
+    return [timestamp for timestamp in ds.time.values if pd.to_datetime(str(timestamp)).hour % 6 == 0]
+
+def frame_field(var, level, timestamp, data_dir=base_dir):
+    # Read once per time step, however many series plot it
+    key = (var, level, timestamp)
+    if key not in frame_fields:
+        ds = load_main_variable(var, level, data_dir)
+        data = ds[list(ds.data_vars)[0]].sel(time=timestamp)
+
+        # Select level if required
+        if level not in ["surface", "column"]:
+            if "model_level_number" in data.dims:
+                data = data.sel(model_level_number=level_map[level])
+            elif "pressure" in data.dims:
+                data = data.sel(pressure=int(level.replace("mb", "")))
+            else:
+                raise ValueError(f"Unexpected vertical coordinate in data: {data.dims}")
+        frame_fields[key] = data.squeeze().load()
+    return frame_fields[key]
+
+def render_frame(series, timestamp, data_dir=base_dir, plot_dir=plot_dir):
+    main_var, main_level, contour_var, quiver = series
+    config = COLOR_CONFIG[main_var]
+    print(f"🔄 Plotting {main_var} at {main_level} — {pd.to_datetime(str(timestamp)):%Y-%m-%d %H:%M}")
+
+    data = frame_field(main_var, main_level, timestamp, data_dir)
+
+    # === PLOT BASE VARIABLE (map only rebuilt when the grid changes) ===
     lon, lat = get_lon_lat(data)
-    lon2d, lat2d = np.meshgrid(lon, lat)
-    mesh = ax.pcolormesh(
-        lon2d, lat2d, data,
-        cmap=cmap, shading="auto", transform=proj,
-        vmin=bounds[0], vmax=bounds[-1]
-    )
+    template = templates.get(series)
+    if template is None or not reuse_map or not template.fits(lon, lat):
+        if template is not None:
+            template.close()
+        template = templates[series] = MapTemplate(lon, lat, config["cmap"], config["bounds"], config["label"])
+    template.update(data)
+    ax, proj = template.ax, template.proj
 
     # === PLOT CONTOUR OVERLAY ===
     if contour_var:
-        contour_name = list(ds_contour.data_vars)[0]
-        contour_data = ds_contour[contour_name].sel(time=timestamp)
-
-        if main_level not in ["surface", "column"]:
-            if "model_level_number" in contour_data.dims:
-                contour_data = contour_data.sel(model_level_number=level_map[main_level])
-            elif "pressure" in contour_data.dims:
-                contour_data = contour_data.sel(pressure=int(main_level.replace("mb", "")))
-        contour_data = contour_data.squeeze()
+        contour_data = frame_field(contour_var, main_level, timestamp, data_dir)
 
         lon_c, lat_c = get_lon_lat(contour_data)
         lon2d_c, lat2d_c = np.meshgrid(lon_c, lat_c)
@@ -81,39 +103,78 @@ for i, timestamp in enumerate(ds.time.values):
         style = CONTOUR_CONFIG.get((main_var, contour_var), {})
         levels = np.linspace(np.nanmin(contour_values), np.nanmax(contour_values), 60)
 
-        cs = ax.contour(lon2d_c, lat2d_c, contour_values, levels=levels, transform=proj, **style)
+        cs = template.add(ax.contour(lon2d_c, lat2d_c, contour_values, levels=levels, transform=proj, **style))
         ax.clabel(cs, inline=1, fontsize=8, fmt="%d")
 
     # === PLOT WIND QUIVERS ===
     if quiver:
-        u_ds = load_main_variable("UGRD", main_level)
-        v_ds = load_main_variable("VGRD", main_level)
-        u = u_ds[list(u_ds.data_vars)[0]].sel(time=timestamp)
-        v = v_ds[list(v_ds.data_vars)[0]].sel(time=timestamp)
-
-        if main_level not in ["surface", "column"]:
-            if "model_level_number" in u.dims:
-                u = u.sel(model_level_number=level_map[main_level])
-                v = v.sel(model_level_number=level_map[main_level])
-            elif "pressure" in u.dims:
-                pval = int(main_level.replace("mb", ""))
-                u = u.sel(pressure=pval)
-                v = v.sel(pressure=pval)
-                u = u.squeeze()
-        v = v.squeeze()
+        u = frame_field("UGRD", main_level, timestamp, data_dir)
+        v = frame_field("VGRD", main_level, timestamp, data_dir)
         lon, lat = get_lon_lat(u)
-        plot_quivers(ax, u.values, v.values, lat, lon, proj)
+        template.add(plot_quivers(ax, u.values, v.values, lat, lon, proj))
 
 
     # === FINALIZE PLOT ===
     title = format_title(main_var, main_level, timestamp, contour_var)
-    plt.title(title, fontsize=16)
-    cbar = plt.colorbar(mesh, ax=ax, orientation="vertical", pad=0.02, aspect=30)
-    cbar.set_label(label)
 
     dt = pd.to_datetime(str(timestamp))
     timestamp_str = dt.strftime("%Y%m%d") + f"_t{dt.strftime('%H')}z"
 
     suffix = f"{main_var}_{contour_var}_{main_level}_{timestamp_str}.png" if contour_var else f"{main_var}_{main_level}_{timestamp_str}.png"
-    plt.savefig(os.path.join(out_dir, suffix), dpi=150, bbox_inches="tight")
-    plt.close()
+    out_dir = out_dir_for(series, plot_dir)
+    os.makedirs(out_dir, exist_ok=True)
+    template.save(title, os.path.join(out_dir, suffix))
+    return os.path.join(out_dir, suffix)
+
+def render_frames(frames, data_dir=base_dir, plot_dir=plot_dir):
+    """
+    One worker's block of consecutive (timestamp, series list) frames. Every
+    series is drawn for a time step before moving on, so fields they share
+    are read once.
+    """
+    # Keep every field open for the whole run
+    fields = {field for _, series_list in frames for series in series_list for field in series_fields(series)}
+    utils.cache_size = max(utils.cache_size, len(fields))
+
+    saved = []
+    for timestamp, series_list in frames:
+        frame_fields.clear()
+        for series in series_list:
+            if len(series_list) == 1:
+                saved.append(render_frame(series, timestamp, data_dir, plot_dir))
+                continue
+            # One broken series should not stop the rest of a batch
+            try:
+                saved.append(render_frame(series, timestamp, data_dir, plot_dir))
+            except Exception as e:
+                print(f"❌ {' '.join(map(str, series))} at {timestamp}: {e}")
+    frame_fields.clear()
+    for template in templates.values():
+        template.close()
+    templates.clear()
+    utils.clear_cache()
+    return saved
+
+def main(series_list, workers=1, data_dir=base_dir, plot_dir=plot_dir):
+    # Time steps in order, each with the series that have it
+    series_times = {series: frame_times(series, data_dir) for series in series_list}
+    timestamps = sorted({timestamp for times in series_times.values() for timestamp in times})
+    frames = [(timestamp, [series for series in series_list if timestamp in series_times[series]])
+              for timestamp in timestamps]
+
+    if workers <= 1:
+        saved = render_frames(frames, data_dir, plot_dir)
+    else:
+        # Contiguous blocks keep output order deterministic; workers are spawned so
+        # each one opens its own files and reads only its own time steps
+        blocks = [frames[b[0]:b[-1] + 1] for b in np.array_split(np.arange(len(frames)), workers) if len(b)]
+        with ProcessPoolExecutor(max_workers=len(blocks), mp_context=multiprocessing.get_context("spawn")) as pool:
+            args = [blocks, [data_dir] * len(blocks), [plot_dir] * len(blocks)]
+            saved = [path for block in pool.map(render_frames, *args) for path in block]
+    print(f"\n📊 Saved {len(saved)} frames")
+    return saved
+
+if __name__ == "__main__":
+    if "--workers" in sys.argv:
+        workers = int(sys.argv[sys.argv.index("--workers") + 1])
+    main([(main_var, main_level, contour_var, quiver)], workers)
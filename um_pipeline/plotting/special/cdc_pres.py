@@ -11,7 +11,6 @@ import cartopy.crs as ccrs
 # === CONFIGURATION ===
 base_dir = "/ocean/projects/atm200005p/esohn1/gfsum_master/data/um/u-dq502/0716"
 output_dir = "/ocean/projects/atm200005p/esohn1/gfsum_master/plots/um/cdc_pres"
-create_output_dir(output_dir)
 
 file_map = {
     "LCDC": ("glm_low_type_cloud_area_fraction_m01s09i203.nc", "low_type_cloud_area_fraction", "Blues", "Low Cloud Cover (0–1)"),
@@ -25,53 +24,64 @@ subfolder_map = {
     "HCDC": "high"
 }
 
-# === Load full cloud and pressure datasets
-cloud_datasets = {}
-for key in ["LCDC", "MCDC", "HCDC"]:
-    filename, varname, *_ = file_map[key]
-    cloud_datasets[key] = xr.open_dataset(os.path.join(base_dir, filename))[varname]
+def main(base_dir=base_dir, output_dir=output_dir):
+    create_output_dir(output_dir)
 
-pres = xr.open_dataset(os.path.join(base_dir, file_map["PRES"][0]))[file_map["PRES"][1]] / 100
+    # === Load full cloud and pressure datasets
+    datasets = {key: xr.open_dataset(os.path.join(base_dir, file_map[key][0])) for key in file_map}
+    cloud_datasets = {key: datasets[key][file_map[key][1]] for key in ["LCDC", "MCDC", "HCDC"]}
+    pres = datasets["PRES"][file_map["PRES"][1]] / 100
 
-# === Loop over time steps in LCDC only (all cloud types should share time dim)
-for timestamp in cloud_datasets["LCDC"].time.values:
-    dt = np.datetime64(timestamp).astype("datetime64[h]").astype(datetime)
-    if dt.hour % 6 != 0:
-        continue
+    saved = []
 
-    for key in ["LCDC", "MCDC", "HCDC"]:
-        try:
-            cloud = cloud_datasets[key].sel(time=timestamp).squeeze()
-            pres_t = pres.sel(time=timestamp).squeeze()
+    # === Loop over time steps in LCDC only (all cloud types should share time dim)
+    for timestamp in cloud_datasets["LCDC"].time.values:
+        dt = np.datetime64(timestamp).astype("datetime64[h]").astype(datetime)
+        if dt.hour % 6 != 0:
+            continue
 
-            _, _, cmap, label = file_map[key]
-            subfolder = subfolder_map[key]
-            out_dir = os.path.join(output_dir, subfolder)
-            os.makedirs(out_dir, exist_ok=True)
+        for key in ["LCDC", "MCDC", "HCDC"]:
+            try:
+                cloud = cloud_datasets[key].sel(time=timestamp).squeeze()
+                pres_t = pres.sel(time=timestamp).squeeze()
 
-            lon = cloud["longitude"]
-            lat = cloud["latitude"]
-            lon2d, lat2d = np.meshgrid(lon, lat)
+                _, _, cmap, label = file_map[key]
+                subfolder = subfolder_map[key]
+                out_dir = os.path.join(output_dir, subfolder)
+                os.makedirs(out_dir, exist_ok=True)
 
-            fig, ax, proj = setup_map()
+                lon = cloud["longitude"]
+                lat = cloud["latitude"]
+                lon2d, lat2d = np.meshgrid(lon, lat)
 
-            pcm = ax.pcolormesh(lon2d, lat2d, cloud,
-                                cmap=cmap, vmin=0, vmax=1,
-                                transform=proj)
+                fig, ax, proj = setup_map()
 
-            cbar = fig.colorbar(pcm, ax=ax, orientation="vertical", shrink=0.6, pad=0.02)
-            cbar.set_label(label)
+                pcm = ax.pcolormesh(lon2d, lat2d, cloud,
+                                    cmap=cmap, vmin=0, vmax=1,
+                                    transform=proj)
 
-            ax.contour(pres["longitude"], pres["latitude"], pres_t,
-                       levels=np.arange(960, 1040, 4),
-                       colors="tan", linewidths=0.8, transform=proj)
+                cbar = fig.colorbar(pcm, ax=ax, orientation="vertical", shrink=0.6, pad=0.02)
+                cbar.set_label(label)
 
-            ax.set_title(f"{label} with Sea-Level Pressure (hPa)\nValid: {dt:%Y-%m-%d %H:%MZ}")
+                ax.contour(pres["longitude"], pres["latitude"], pres_t,
+                           levels=np.arange(960, 1040, 4),
+                           colors="tan", linewidths=0.8, transform=proj)
 
-            timestamp_str = dt.strftime("%Y%m%d_t%Hz")
-            fname = f"{key.lower()}_pres_{timestamp_str}.png"
-            plt.savefig(os.path.join(out_dir, fname), dpi=150, bbox_inches="tight")
-            plt.close()
+                ax.set_title(f"{label} with Sea-Level Pressure (hPa)\nValid: {dt:%Y-%m-%d %H:%MZ}")
 
-        except Exception as e:
-            print(f"❌ Failed to plot {key} for {timestamp}: {e}")
+                timestamp_str = dt.strftime("%Y%m%d_t%Hz")
+                fname = f"{key.lower()}_pres_{timestamp_str}.png"
+                plt.savefig(os.path.join(out_dir, fname), dpi=150, bbox_inches="tight")
+                saved.append(os.path.join(out_dir, fname))
+
+            except Exception as e:
+                print(f"❌ Failed to plot {key} for {timestamp}: {e}")
+            finally:
+                plt.close()
+
+    for ds in datasets.values():
+        ds.close()
+    return saved
+
+if __name__ == "__main__":
+    main()
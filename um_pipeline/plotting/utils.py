@@ -1,4 +1,5 @@
 import os
+from collections import OrderedDict
 import numpy as np
 import xarray as xr
 import pandas as pd
@@ -9,6 +10,31 @@ import matplotlib.pyplot as plt
 from um_pipeline.plotting.color_config import CONTOUR_CONFIG, COLOR_CONFIG
 import matplotlib.ticker as mticker
 
+# === Dataset cache ===
+# load_main_variable results stay open between calls, keyed by
+# (source, var, level, file), so a frame loop opens each file once. Past
+# DATASET_CACHE_SIZE entries the least recently used one is closed.
+cache_size = int(os.getenv("DATASET_CACHE_SIZE", "16"))
+dataset_cache = OrderedDict()
+
+def cached(key, load):
+    if key in dataset_cache:
+        dataset_cache.move_to_end(key)
+        return dataset_cache[key]
+    ds = dataset_cache[key] = load()
+    while len(dataset_cache) > cache_size:
+        dataset_cache.popitem(last=False)[1].close()
+    return ds
+
+def clear_cache():
+    while dataset_cache:
+        dataset_cache.popitem()[1].close()
+
+def closing(result, *sources):
+    # Closing a dataset derived from open files closes those files
+    result.set_close(lambda: [src.close() for src in sources])
+    return result
+
 def create_output_dir(path):
     if not os.path.exists(path):
         os.makedirs(path)
@@ -29,6 +55,47 @@ def setup_map():
     gl.ylocator = mticker.FixedLocator(np.linspace(-65, -30, 8))
     return fig, ax, proj
 
+# === Map template ===
+class MapTemplate:
+    """
+    One figure reused for every frame of a (var, level) series. The map
+    background, shaded mesh and colorbar are built once; each frame swaps the
+    mesh data, redraws the overlays (contours, labels, quivers) and saves.
+    """
+    def __init__(self, lon, lat, cmap, bounds, label):
+        self.fig, self.ax, self.proj = setup_map()
+        self.lon, self.lat = np.asarray(lon), np.asarray(lat)
+        lon2d, lat2d = np.meshgrid(self.lon, self.lat)
+        self.mesh = self.ax.pcolormesh(
+            lon2d, lat2d, np.zeros(lon2d.shape),
+            cmap=cmap, shading="auto", transform=self.proj,
+            vmin=bounds[0], vmax=bounds[-1]
+        )
+        cbar = self.fig.colorbar(self.mesh, ax=self.ax, orientation="vertical", pad=0.02, aspect=30)
+        cbar.set_label(label)
+        self.overlays = []
+
+    def fits(self, lon, lat):
+        return np.array_equal(self.lon, np.asarray(lon)) and np.array_equal(self.lat, np.asarray(lat))
+
+    def update(self, data):
+        for artist in self.overlays:
+            artist.remove()
+        self.overlays = []
+        self.mesh.set_array(np.ma.masked_invalid(np.asarray(data)))
+
+    def add(self, artist):
+        if artist is not None:
+            self.overlays.append(artist)
+        return artist
+
+    def save(self, title, path):
+        self.ax.set_title(title, fontsize=16)
+        self.fig.savefig(path, dpi=150, bbox_inches="tight")
+
+    def close(self):
+        plt.close(self.fig)
+
 # === Title formatting ===
 def format_title(var, level, timestamp, contour_var=None):
     valid_time = pd.to_datetime(str(timestamp)).strftime("%Y-%m-%d %H:%M:%S")
@@ -56,7 +123,7 @@ def plot_quivers(ax, u, v, lat, lon, proj, stride=4):
     # Optional debug
     # print(f"[DEBUG] u shape: {u.shape}, v shape: {v.shape}, lon2d shape: {lon2d.shape}")
 
-    ax.quiver(
+    return ax.quiver(
         lon2d[::stride, ::stride], lat2d[::stride, ::stride],
         u[::stride, ::stride], v[::stride, ::stride],
         transform=proj,
@@ -141,45 +208,69 @@ var_name_map = {
 
 base_dir = "/ocean/projects/atm200005p/esohn1/gfsum_master/data/um/u-dq502/0716"
 
-def load_main_variable(var, level):
+def plev_file(var):
+    # Written by download/interp_pressure.py next to the model-level files
+    if var == "TMP":
+        return "glm_air_temperature_plev.nc"
+    return file_map[var].replace(".nc", "_plev.nc") if var in file_map else None
+
+def main_variable_file(var, level, data_dir=base_dir):
+    # Pressure-level files (true mb levels instead of level_map), when present
+    fname = plev_file(var) if str(level).endswith("mb") else None
+    if fname and os.path.exists(os.path.join(data_dir, fname)):
+        return os.path.join(data_dir, fname)
+    # TMP is computed from POT + PRES
+    return os.path.join(data_dir, file_map["POT"] if var == "TMP" else file_map[var])
+
+def load_main_variable(var, level, data_dir=base_dir):
+    fpath = main_variable_file(var, level, data_dir)
+    return cached(("um", var, level, fpath), lambda: open_main_variable(var, level, fpath))
+
+def open_main_variable(var, level, fpath):
+    # Companion files (POT and PRES for TMP and LWC) sit next to fpath
+    data_dir = os.path.dirname(fpath)
+    if fpath.endswith("_plev.nc"):
+        ds = xr.open_dataset(fpath, decode_timedelta=True)
+        var_name = var_name_map.get(var, var)
+        return closing(ds[[var_name]].rename({var_name: var}), ds)
+
     if var == "TMP":
-        pot = xr.open_dataset(os.path.join(base_dir, file_map["POT"]))["air_potential_temperature"]
-        pres = xr.open_dataset(os.path.join(base_dir, file_map["PRES"]))["air_pressure"]
-        tmp = calculate_temperature(pot, pres)
+        pot_ds = xr.open_dataset(os.path.join(data_dir, file_map["POT"]))
+        pres_ds = xr.open_dataset(os.path.join(data_dir, file_map["PRES"]))
+        pot = pot_ds["air_potential_temperature"]
+        tmp = calculate_temperature(pot, pres_ds["air_pressure"])
         tmp.attrs = pot.attrs
-        return tmp.to_dataset(name="TMP")
+        return closing(tmp.to_dataset(name="TMP"), pot_ds, pres_ds)
 
     # === Special case: Column-integrated LWC
     elif var == "LWC" and level == "column":
-        clmr_ds = xr.open_dataset(os.path.join(base_dir, file_map["LWC"]), decode_timedelta=True)
+        clmr_ds = xr.open_dataset(os.path.join(data_dir, file_map["LWC"]), decode_timedelta=True)
         clmr = clmr_ds["mass_fraction_of_cloud_liquid_water_in_air"]
-        pot = xr.open_dataset(os.path.join(base_dir, file_map["POT"]), decode_timedelta=True)["air_potential_temperature"]
-        pres = xr.open_dataset(os.path.join(base_dir, file_map["PRES"]), decode_timedelta=True)["air_pressure"]
+        pot_ds = xr.open_dataset(os.path.join(data_dir, file_map["POT"]), decode_timedelta=True)
+        pres_ds = xr.open_dataset(os.path.join(data_dir, file_map["PRES"]), decode_timedelta=True)
         height = clmr_ds["level_height"]
-        lwc = calculate_lwc_column(clmr, pot, pres, height)
+        lwc = calculate_lwc_column(clmr, pot_ds["air_potential_temperature"], pres_ds["air_pressure"], height)
         lwc.attrs["units"] = "kg/m²"
         lwc.attrs["long_name"] = "Column Liquid Water Content"
-        return lwc.to_dataset(name="LWC")
+        return closing(lwc.to_dataset(name="LWC"), clmr_ds, pot_ds, pres_ds)
 
 
     # === Special case: HPBL_surface fallback
     elif var == "HPBL" and level == "surface":
-        fpath = os.path.join(base_dir, file_map["HPBL"])
         ds = xr.open_dataset(fpath)
         if "m01s03i073" in ds:
-            return ds[["m01s03i073"]]
+            return closing(ds[["m01s03i073"]], ds)
         else:
             varname = list(ds.data_vars)[0]
-            return ds[[varname]].rename({varname: "HPBL"})
+            return closing(ds[[varname]].rename({varname: "HPBL"}), ds)
 
     # === Standard case
     else:
-        fpath = os.path.join(base_dir, file_map[var])
         ds = xr.open_dataset(fpath, decode_timedelta=True)
         var_name = var_name_map.get(var, var)
 
         if var_name not in ds.data_vars:
+            ds.close()
             raise KeyError(f"Expected variable '{var_name}' not found in {fpath}. Available: {list(ds.data_vars)}")
 
-        return ds[[var_name]].rename({var_name: var})
-
+        return closing(ds[[var_name]].rename({var_name: var}), ds)
@@ -8,25 +8,33 @@ import matplotlib.pyplot as plt
 csv_path = "/ocean/projects/atm200005p/esohn1/gfsum_master/stats/um/spfh_5day_summary.csv"
 output_path = "/ocean/projects/atm200005p/esohn1/gfsum_master/stats/um/figures/spfh_5day_summary_plot.png"
 
-# === Load and Plot ===
-df = pd.read_csv(csv_path)
-
-levels = df["level"]
-mins = df["SPFH_min"]
-maxs = df["SPFH_max"]
-means = df["SPFH_mean"]
-
-plt.figure(figsize=(8, 5))
-plt.bar(levels, maxs, label="Max SPFH", color="skyblue")
-plt.bar(levels, mins, label="Min SPFH", color="lightcoral")
-plt.plot(levels, means, label="Mean SPFH", color="black", marker="o", linestyle="--")
-
-plt.xlabel("Pressure Level")
-plt.ylabel("Specific Humidity (kg/kg)")
-plt.title("UM: 5-Day Summary of Specific Humidity (SPFH)")
-plt.legend()
-plt.tight_layout()
-plt.savefig(output_path)
-plt.close()
-
-print(f"✅ UM SPFH summary plot saved to {output_path}")
+
+def main(csv_path=csv_path, output_path=output_path):
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+    # === Load and Plot ===
+    df = pd.read_csv(csv_path)
+
+    levels = df["level"]
+    mins = df["SPFH_min"]
+    maxs = df["SPFH_max"]
+    means = df["SPFH_mean"]
+
+    plt.figure(figsize=(8, 5))
+    plt.bar(levels, maxs, label="Max SPFH", color="skyblue")
+    plt.bar(levels, mins, label="Min SPFH", color="lightcoral")
+    plt.plot(levels, means, label="Mean SPFH", color="black", marker="o", linestyle="--")
+
+    plt.xlabel("Pressure Level")
+    plt.ylabel("Specific Humidity (kg/kg)")
+    plt.title("UM: 5-Day Summary of Specific Humidity (SPFH)")
+    plt.legend()
+    plt.tight_layout()
+    plt.savefig(output_path)
+    plt.close()
+
+    print(f"✅ UM SPFH summary plot saved to {output_path}")
+    return output_path
+
+if __name__ == "__main__":
+    main()
@@ -5,23 +5,30 @@ import os
 
 csv_path = "/ocean/projects/atm200005p/esohn1/gfsum_master/stats/um/tmp_5day_summary.csv"
 output_dir = "/ocean/projects/atm200005p/esohn1/gfsum_master/stats/um/figures"
-os.makedirs(output_dir, exist_ok=True)
 
-df = pd.read_csv(csv_path)
+def main(csv_path=csv_path, output_dir=output_dir):
+    os.makedirs(output_dir, exist_ok=True)
 
-plt.figure(figsize=(8, 5))
-levels = df['Level']
-x = range(len(levels))
-plt.plot(x, df['TMP_min'], label='Min TMP', marker='o')
-plt.plot(x, df['TMP_max'], label='Max TMP', marker='o')
-plt.plot(x, df['TMP_mean'], label='Mean TMP', marker='o')
+    df = pd.read_csv(csv_path)
 
-plt.xticks(x, levels)
-plt.xlabel("Pressure Level")
-plt.ylabel("Temperature (K)")
-plt.title("5-Day Summary of Temperature (GFS)")
-plt.legend()
-plt.grid(True)
-plt.tight_layout()
-plt.savefig(os.path.join(output_dir, "tmp_5day_summary_plot.png"))
-plt.close()
+    plt.figure(figsize=(8, 5))
+    levels = df['Level']
+    x = range(len(levels))
+    plt.plot(x, df['TMP_min'], label='Min TMP', marker='o')
+    plt.plot(x, df['TMP_max'], label='Max TMP', marker='o')
+    plt.plot(x, df['TMP_mean'], label='Mean TMP', marker='o')
+
+    plt.xticks(x, levels)
+    plt.xlabel("Pressure Level")
+    plt.ylabel("Temperature (K)")
+    plt.title("5-Day Summary of Temperature (GFS)")
+    plt.legend()
+    plt.grid(True)
+    plt.tight_layout()
+    out_path = os.path.join(output_dir, "tmp_5day_summary_plot.png")
+    plt.savefig(out_path)
+    plt.close()
+    return out_path
+
+if __name__ == "__main__":
+    main()
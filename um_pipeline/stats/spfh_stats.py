@@ -14,32 +14,45 @@ levels = {
 }
 base_dir = f"/ocean/projects/atm200005p/esohn1/gfsum_master/data/{source}/u-dq502/0716"
 output_csv = f"/ocean/projects/atm200005p/esohn1/gfsum_master/stats/{source}/spfh_5day_summary.csv"
-os.makedirs(os.path.dirname(output_csv), exist_ok=True)
 
-# === Load dataset ===
-file_path = os.path.join(base_dir, "glm_specific_humidity_m01s00i010.nc")
-ds = xr.open_dataset(file_path)
-spfh = ds["specific_humidity"]  # (time, model_level_number, lat, lon)
+def main(base_dir=base_dir, output_csv=output_csv, levels=levels):
+    os.makedirs(os.path.dirname(output_csv), exist_ok=True)
 
-# Convert time to datetime
-ds["time"] = pd.to_datetime(ds["time"].values)
+    # === Load dataset ===
+    # Pressure-level file from download/interp_pressure.py when present,
+    # otherwise the model levels in `levels`
+    file_path = os.path.join(base_dir, "glm_specific_humidity_m01s00i010.nc")
+    plev_path = file_path.replace(".nc", "_plev.nc")
+    on_pressure = os.path.exists(plev_path)
+    with xr.open_dataset(plev_path if on_pressure else file_path) as ds:
+        spfh = ds["specific_humidity"]  # (time, pressure or model_level_number, lat, lon)
 
-# === Compute summary across all time steps for each level ===
-records = []
-for level_str, level_idx in levels.items():
-    try:
-        level_data = spfh[:, level_idx, :, :]  # shape: (time, lat, lon)
-        records.append({
-            "level": level_str,
-            "SPFH_min": float(level_data.min().values),
-            "SPFH_max": float(level_data.max().values),
-            "SPFH_mean": float(level_data.mean().values)
-        })
-    except IndexError:
-        print(f"⚠️ Level {level_str} index {level_idx} missing")
-        continue
+        # Convert time to datetime
+        ds["time"] = pd.to_datetime(ds["time"].values)
 
-# === Save ===
-df = pd.DataFrame(records)
-df.to_csv(output_csv, index=False)
-print(f"✅ Saved 5-day SPFH summary to {output_csv}")
+        # === Compute summary across all time steps for each level ===
+        records = []
+        for level_str, level_idx in levels.items():
+            try:
+                if on_pressure:
+                    level_data = spfh.sel(pressure=int(level_str.replace("mb", "")))
+                else:
+                    level_data = spfh[:, level_idx, :, :]  # shape: (time, lat, lon)
+                records.append({
+                    "level": level_str,
+                    "SPFH_min": float(level_data.min().values),
+                    "SPFH_max": float(level_data.max().values),
+                    "SPFH_mean": float(level_data.mean().values)
+                })
+            except (IndexError, KeyError):
+                print(f"⚠️ Level {level_str} index {level_idx} missing")
+                continue
+
+    # === Save ===
+    df = pd.DataFrame(records)
+    df.to_csv(output_csv, index=False)
+    print(f"✅ Saved 5-day SPFH summary to {output_csv}")
+    return df
+
+if __name__ == "__main__":
+    main()
@@ -9,16 +9,6 @@ import numpy as np
 source = "um"
 base_dir = "/ocean/projects/atm200005p/esohn1/gfsum_master/data/um/u-dq502/0716"
 output_csv = f"/ocean/projects/atm200005p/esohn1/gfsum_master/stats/{source}/tmp_5day_summary.csv"
-os.makedirs(os.path.dirname(output_csv), exist_ok=True)
-
-pot_path = os.path.join(base_dir, "glm_air_potential_temperature_m01s00i004.nc")
-pres_path = os.path.join(base_dir, "glm_air_pressure_m01s00i408.nc")
-
-ds_pot = xr.open_dataset(pot_path)
-ds_pres = xr.open_dataset(pres_path)
-
-theta = ds_pot["air_potential_temperature"]  # (time, level, lat, lon)
-pres = ds_pres["air_pressure"]               # (time, level, lat, lon)
 
 # Constants
 p0 = 100000  # reference pressure in Pa
@@ -28,12 +18,12 @@ R_over_cp = 0.286  # Rd/cp
 target_pressures = [100000, 85000, 70000, 50000, 30000]
 pressure_labels = ["1000mb", "850mb", "700mb", "500mb", "300mb"]
 
-summary_records = []
-
-for p_target, label in zip(target_pressures, pressure_labels):
-    print(f"📍 Processing level: {label}")
+def nearest_level_temps(theta, pres, p_target, label):
+    """
+    Fallback for cycles without glm_air_temperature_plev.nc: TMP on the model
+    level whose domain-mean pressure is nearest p_target, per time step.
+    """
     all_temps = []
-
     for t in range(len(theta.time)):
         theta_t = theta.isel(time=t)
         pres_t = pres.isel(time=t)
@@ -54,17 +44,50 @@ for p_target, label in zip(target_pressures, pressure_labels):
             all_temps.append(temp_interp)
         except Exception as e:
             print(f"⚠️ Skipping level {label} at time {t}: {e}")
-
-    if all_temps:
-        all_data = xr.concat(all_temps, dim="time")
-        summary_records.append({
-            "Level": label,
-            "TMP_min": float(all_data.min().values),
-            "TMP_max": float(all_data.max().values),
-            "TMP_mean": float(all_data.mean().values)
-        })
-
-# Save CSV
-df = pd.DataFrame(summary_records)
-df.to_csv(output_csv, index=False)
-print(f"✅ Saved 5-day TMP summary to {output_csv}")
+    return xr.concat(all_temps, dim="time") if all_temps else None
+
+def main(base_dir=base_dir, output_csv=output_csv):
+    os.makedirs(os.path.dirname(output_csv), exist_ok=True)
+
+    tmp_plev_path = os.path.join(base_dir, "glm_air_temperature_plev.nc")
+    pot_path = os.path.join(base_dir, "glm_air_potential_temperature_m01s00i004.nc")
+    pres_path = os.path.join(base_dir, "glm_air_pressure_m01s00i408.nc")
+
+    if os.path.exists(tmp_plev_path):
+        # Interpolated to pressure levels by download/interp_pressure.py
+        datasets = [xr.open_dataset(tmp_plev_path)]
+        tmp_plev = datasets[0]["air_temperature"]  # (time, pressure, lat, lon)
+    else:
+        print(f"⚠️ {tmp_plev_path} not found, using the nearest model level")
+        tmp_plev = None
+        datasets = [xr.open_dataset(pot_path), xr.open_dataset(pres_path)]
+        theta = datasets[0]["air_potential_temperature"]  # (time, level, lat, lon)
+        pres = datasets[1]["air_pressure"]                 # (time, level, lat, lon)
+
+    summary_records = []
+
+    for p_target, label in zip(target_pressures, pressure_labels):
+        print(f"📍 Processing level: {label}")
+        if tmp_plev is not None:
+            all_data = tmp_plev.sel(pressure=p_target // 100)
+        else:
+            all_data = nearest_level_temps(theta, pres, p_target, label)
+
+        if all_data is not None:
+            summary_records.append({
+                "Level": label,
+                "TMP_min": float(all_data.min().values),
+                "TMP_max": float(all_data.max().values),
+                "TMP_mean": float(all_data.mean().values)
+            })
+    for ds in datasets:
+        ds.close()
+
+    # Save CSV
+    df = pd.DataFrame(summary_records)
+    df.to_csv(output_csv, index=False)
+    print(f"✅ Saved 5-day TMP summary to {output_csv}")
+    return df
+
+if __name__ == "__main__":
+    main()